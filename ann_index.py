@@ -0,0 +1,185 @@
+"""
+Gallery search indexes
+Exact brute-force search, an inverted-file (IVF) approximate index for very large galleries,
+and per-identity prototype matching
+"""
+
+import numpy as np
+from matcher import EmbeddingMatcher
+from prototypes import PrototypeIndex
+
+INDEX_TYPES = ("exact", "ivf", "prototype")
+
+
+def nearest_centroids(vectors, centroids, chunk_size=8192):
+    """Index of the closest centroid for every vector (squared euclidean), computed in chunks"""
+    centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        # ||v - c||^2 = ||v||^2 - 2 v.c + ||c||^2, and ||v||^2 does not change the argmin
+        assignments[start:start + chunk_size] = np.argmin(centroid_sq_norms[None, :] - 2 * chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def kmeans(vectors, k, iterations=10, seed=0):
+    """Plain Lloyd's k-means, returning (k x dim) centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = np.array(vectors[rng.choice(len(vectors), k, replace=False)], dtype=np.float32)
+
+    for _ in range(iterations):
+        assignments = nearest_centroids(vectors, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+
+        # Empty clusters keep their previous centroid
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+
+    return centroids
+
+
+def nearest_centroid_distances(probes, centroids):
+    """Squared euclidean distance from every probe to every centroid"""
+    sq = (np.einsum('ij,ij->i', probes, probes)[:, None]
+          + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+          - 2 * probes @ centroids.T)
+    return np.maximum(sq, 0)
+
+
+class ExactIndex:
+    """Brute-force search over every gallery row"""
+
+    def __init__(self, embeddings, labels, distance_metric="cosine", prenormalized=False):
+        self.matcher = EmbeddingMatcher(embeddings, labels, distance_metric, prenormalized)
+
+    @classmethod
+    def _wrap(cls, matcher):
+        index = cls.__new__(cls)
+        index.matcher = matcher
+        return index
+
+    def __len__(self):
+        return len(self.matcher)
+
+    def extended(self, embeddings, labels):
+        """Index after rows were appended to the gallery"""
+        return self._wrap(self.matcher.extended(embeddings, labels))
+
+    def relabeled(self, labels):
+        """Index after rows were deleted (labelled None)"""
+        return self._wrap(self.matcher.relabeled(labels))
+
+    def search(self, probes, k=1):
+        return self.matcher.search(probes, k)
+
+
+class IVFIndex:
+    """Inverted-file index: rows are bucketed under their nearest k-means centroid and a probe
+    only scans the rows of its nprobe closest buckets
+
+    Raising nprobe trades speed for recall; nprobe == nlist is an exact search.
+    """
+
+    def __init__(self, embeddings, labels, distance_metric="cosine", prenormalized=False,
+                 nlist=None, nprobe=8, train_size=50000, iterations=10, seed=0):
+        self.matcher = EmbeddingMatcher(embeddings, labels, distance_metric, prenormalized)
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.iterations = iterations
+        self.seed = seed
+
+        valid_rows = np.flatnonzero(self.matcher.valid)
+        # About sqrt(n) buckets keeps both the centroid scan and each bucket small
+        self.nlist = max(1, min(nlist or int(np.sqrt(len(valid_rows))), len(valid_rows)))
+        self.trained_size = len(valid_rows)
+
+        if len(valid_rows) == 0:
+            self.centroids = np.zeros((0, self.matcher.gallery.shape[1]), dtype=np.float32)
+            self.lists = []
+            return
+
+        rng = np.random.default_rng(seed)
+        sample = valid_rows
+        if len(sample) > train_size:
+            sample = np.sort(rng.choice(valid_rows, train_size, replace=False))
+        self.centroids = kmeans(np.asarray(self.matcher.gallery[sample], dtype=np.float32),
+                                self.nlist, iterations, seed)
+
+        vectors = self.matcher.gallery if len(valid_rows) == len(self.matcher.labels) else self.matcher.gallery[valid_rows]
+        assignments = nearest_centroids(vectors, self.centroids)
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.searchsorted(assignments[order], np.arange(self.nlist + 1))
+        self.lists = [valid_rows[order[bounds[i]:bounds[i + 1]]] for i in range(self.nlist)]
+
+    def __len__(self):
+        return len(self.matcher)
+
+    def needs_retraining(self, rows):
+        """Whether a gallery of this many live rows has grown well past what the centroids were fitted on"""
+        return rows > 2 * max(self.trained_size, 1) or not self.lists
+
+    def extended(self, embeddings, labels, retrain=True):
+        """Index after rows were appended; new rows go into their nearest bucket without retraining
+
+        Unless retrain is False, the index is retrained once needs_retraining() says so.
+        """
+        matcher = self.matcher.extended(embeddings, labels)
+
+        if not self.lists or (retrain and self.needs_retraining(len(matcher))):
+            return IVFIndex(embeddings, labels, matcher.distance_metric, matcher.prenormalized,
+                            None, self.nprobe, self.train_size, self.iterations, self.seed)
+
+        index = self._copy(matcher)
+        new_rows = np.arange(len(self.matcher.labels), len(matcher.labels))
+        new_rows = new_rows[matcher.valid[new_rows]]
+        if len(new_rows):
+            index.lists = list(self.lists)
+            for row, bucket in zip(new_rows, nearest_centroids(matcher.gallery[new_rows], self.centroids)):
+                index.lists[bucket] = np.append(index.lists[bucket], row)
+        return index
+
+    def relabeled(self, labels):
+        """Index after rows were deleted; deleted rows stay in their buckets but are skipped"""
+        return self._copy(self.matcher.relabeled(labels))
+
+    def _copy(self, matcher):
+        index = IVFIndex.__new__(IVFIndex)
+        index.__dict__.update(self.__dict__)
+        index.matcher = matcher
+        return index
+
+    def search(self, probes, k=1):
+        if len(self.matcher) == 0 or not self.lists:
+            return [[] for _ in range(len(np.atleast_2d(probes)))]
+
+        probes = self.matcher.prepare_probes(probes)
+        nprobe = min(self.nprobe, self.nlist)
+        closest = np.argsort(nearest_centroid_distances(probes, self.centroids), axis=1)[:, :nprobe]
+
+        results = []
+        for probe, buckets in zip(probes, closest):
+            rows = np.concatenate([self.lists[bucket] for bucket in buckets])
+            if len(rows) == 0:
+                results.append([])
+                continue
+            # Exact distances, but only to the rows of the scanned buckets
+            distances = self.matcher.distances(probe, rows)[0]
+            results.append(self.matcher.top_k(distances, k, rows))
+        return results
+
+
+def build_index(index_type, embeddings, labels, distance_metric="cosine", prenormalized=False,
+                min_size=10000, **options):
+    """Index of the requested type; "ivf" galleries smaller than min_size use exact search"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported index type: {index_type}")
+
+    if index_type == "prototype":
+        return PrototypeIndex(embeddings, labels, distance_metric, prenormalized, **options)
+
+    valid = sum(1 for label in labels if label is not None)
+    if index_type == "ivf" and valid >= min_size:
+        return IVFIndex(embeddings, labels, distance_metric, prenormalized, **options)
+    return ExactIndex(embeddings, labels, distance_metric, prenormalized)
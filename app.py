@@ -2,7 +2,6 @@ import os
 import cv2
 import numpy as np
 from flask import Flask, render_template, Response, jsonify, request, redirect, url_for
-from deepface import DeepFace
 import time
 import threading
 import datetime
@@ -11,6 +10,21 @@ from werkzeug.utils import secure_filename
 import base64
 from PIL import Image
 import io
+import json
+import zipfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from embedder import FaceEmbedder
+from gallery import EmbeddingGallery
+from embedding_store import EmbeddingStore
+from embedding_cache import EmbeddingCache
+from matcher import EmbeddingMatcher
+from cameras import CameraRegistry
+from recognition_pool import RecognitionPool
+from tracker import FaceTracker
+from detection import DetectionScheduler
+from probe_cache import ProbeCache
+from metrics import Metrics
 
 app = Flask(__name__)
 
@@ -18,7 +32,14 @@ app = Flask(__name__)
 FACE_DATABASE = "face_database"
 TEMP_DIR = "temp"
 UPLOAD_FOLDER = "uploads"
+EMBEDDING_STORE = "embeddings"
+EMBEDDING_CACHE = os.path.join(EMBEDDING_STORE, "cache")
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+HAAR_CASCADE = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+# Cameras registered at startup: id -> device index, video file, image directory or stream URL
+CAMERAS = {'default': 0}
+DEFAULT_CAMERA = 'default'  # Camera behind /video_feed, /start_camera and /capture_face
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
@@ -29,176 +50,417 @@ os.makedirs(TEMP_DIR, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Global variables
-camera = None
-face_detector = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
 face_recognition_enabled = False
 lock = threading.Lock()
 face_model = "VGG-Face"  # Can be "VGG-Face", "Facenet", "Facenet512", "OpenFace", "DeepFace", "DeepID", "ArcFace", "Dlib"
 distance_metric = "cosine"  # Can be "cosine", "euclidean", "euclidean_l2"
 face_detector_model = "opencv"  # Can be "opencv", "ssd", "dlib", "mtcnn", "retinaface", "mediapipe"
 recognition_threshold = 0.4  # Lower is more strict
+recognition_workers = os.cpu_count() or 1  # Threads running face recognition in the background
+recognition_batch_size = 16  # Most face crops embedded in one forward pass
+recognize_workers = 4  # Threads decoding, detecting and embedding uploaded images for /recognize
+recognize_max_upload = 1024 * 1024 * 1024  # Largest /recognize request (photo dumps); other routes keep MAX_CONTENT_LENGTH
+recognize_max_image = 32 * 1024 * 1024  # Largest image /recognize unpacks from a zip; bigger members are skipped
+align_face_crops = True  # Level the eyes of Haar face crops before embedding (no second detector pass)
+embedding_dtype = "float32"  # Can be "float32" or "float16" for the on-disk embedding store
+embedding_cache_bytes = 512 * 1024 * 1024  # Disk budget of the content-hash embedding cache
+gallery_index = "exact"  # Can be "exact", "ivf" (approximate, for galleries of 10k+ images) or "prototype"
+ivf_nprobe = 8  # Buckets an "ivf" search scans; higher is slower but finds more true matches
+prototype_method = "mean"  # Can be "mean" (one centroid per person) or "medoids" (up to prototypes_per_identity photos)
+prototypes_per_identity = 3  # Prototypes kept per person when prototype_method is "medoids"
+prototype_margin = 0.1  # Prototype distances this close to the threshold are verified against every photo
+recognition_refresh_interval = 5.0  # Seconds before a tracked face is recognized again
+probe_cache_ttl = 0.5  # Seconds a recognized face crop can answer for a near-identical one at the same spot
+probe_cache_size = 64  # Recent face crops remembered per camera
+detection_interval = 1  # Run face detection on every Nth frame
+detection_target_fps = None  # When set, the detection interval adapts to hold this frame rate
+detection_scale = 1.0  # Detect on a frame downscaled by this factor (e.g. 0.5)
+metrics_enabled = True  # Collect pipeline timings and counters for /metrics
+stream_jpeg_quality = 80  # JPEG quality of /video_feed frames (1-100)
+stream_scale = 1.0  # Resize /video_feed frames by this factor before encoding (e.g. 0.5)
+stream_max_fps = None  # When set, each feed produces at most this many frames per second
+jpeg_backend = "auto"  # Can be "auto" (turbojpeg when installed), "opencv" or "turbojpeg"
+
+# Per-stage latencies and frame counters of the video pipeline
+metrics = Metrics(enabled=metrics_enabled, namespace="face_recognition")
+stage_seconds = metrics.histogram("stage_seconds", "Time spent in each stage of the frame pipeline", label="stage")
+frame_rate = metrics.frame_rate("frames_per_second", "Processed frames per second")
+frames_total = metrics.counter("frames_total", "Frames processed")
+faces_per_frame = metrics.histogram("faces_per_frame", "Faces tracked in each frame", buckets=(0, 1, 2, 3, 5, 8, 13))
+dropped_frames = metrics.counter("camera_frames_dropped_total", "Captured frames overwritten before processing")
+recognition_cache = metrics.counter("recognition_cache_total", "Tracked faces that reused a result (hit), reused a recent near-identical crop's result (probe_hit) or were queued for recognition (miss)", label="result")
+
+# Single resident recognition model, warmed up once at process start
+embedder = FaceEmbedder(face_model, face_detector_model, align_crops=align_face_crops)
+
+# Embeddings persisted per model / detector and memory-mapped at startup;
+# rows are stored unit length unless the metric needs their raw magnitude
+embedding_store = EmbeddingStore(
+    EMBEDDING_STORE,
+    face_model,
+    face_detector_model,
+    dtype=embedding_dtype,
+    normalize=distance_metric != "euclidean"
+)
+
+# Embeddings by image content hash, per model / detector, reused whenever the gallery is rebuilt
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE, face_model, face_detector_model, embedding_cache_bytes)
+
+# Settings of each gallery index type
+gallery_index_options = {
+    'exact': {},
+    'ivf': {'nprobe': ivf_nprobe},
+    'prototype': {
+        'method': prototype_method,
+        'prototypes_per_identity': prototypes_per_identity,
+        'threshold': recognition_threshold,
+        'margin': prototype_margin
+    }
+}
+
+# Resident embedding gallery, loaded once the model is warm and matched in memory
+gallery = EmbeddingGallery(
+    embedder,
+    distance_metric,
+    embedding_store,
+    index_type=gallery_index,
+    index_options=gallery_index_options[gallery_index],
+    cache=embedding_cache
+)
+embedder.start(on_ready=lambda: gallery.load(FACE_DATABASE))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def euclidean_distance(a, b):
-    return np.sqrt(np.sum(np.square(a - b)))
+def find_match(img_embedding, embeddings_dict=None, threshold=0.4):
+    # Use the pre-normalized gallery unless an explicit {name: embedding} dict is given
+    if embeddings_dict is None:
+        matches = gallery.search([img_embedding], k=1)[0]
+    else:
+        matcher = EmbeddingMatcher(list(embeddings_dict.values()), list(embeddings_dict.keys()), distance_metric)
+        matches = matcher.search([img_embedding], k=1)[0]
+    
+    # Return the best (name, distance) match, if it is below the threshold
+    if matches and matches[0][1] < threshold:
+        return matches[0][:2]
+    return None
+
+def recognize_faces(face_imgs):
+    # The Haar boxes already isolate one face each, so the crops skip DeepFace's detector backend
+    # Embed all face crops in one batched forward pass, then match them against the gallery at once
+    started = metrics.clock()
+    embeddings = embedder.represent_batch(face_imgs)
+    matches = [matches[0] if matches else None for matches in gallery.search(embeddings, k=1)]
+    stage_seconds.since(started, "recognition")
+    return matches
+
+def match_confidence(match):
+    # Confidence shown for a recognition result; low values make the tracker re-check sooner
+    if isinstance(match, Exception):
+        return None
+    if match is None or match[1] >= recognition_threshold:
+        return 0.0
+    return 1 - (match[1] / recognition_threshold)
 
-def find_match(img_embedding, embeddings_dict, threshold=0.4):
-    matches = []
+class CameraPipeline:
+    """Detection schedule and face tracks of one camera"""
+
+    def __init__(self, camera_id):
+        # Picks the frames that run detection, on a downscaled copy if configured;
+        # every camera gets its own cascade so detections can run in parallel
+        self.detection_scheduler = DetectionScheduler(
+            cv2.CascadeClassifier(HAAR_CASCADE), detection_interval, detection_target_fps, detection_scale
+        )
+
+        # Identities stay attached to face boxes across frames, so each face is recognized once per track
+        self.face_tracker = FaceTracker(refresh_interval=recognition_refresh_interval)
+
+        # Results of recent crops, reused when a new track shows the same face at the same spot;
+        # probe_keys holds the cache key of each track's crop while it is being recognized
+        self.probe_cache = ProbeCache(probe_cache_ttl, probe_cache_size)
+        self.probe_keys = {}
+
+def deliver_result(key, match):
+    # Pool jobs are keyed by (camera_id, track_id) so cameras can share the workers
+    camera_id, track_id = key
+    camera = cameras.get(camera_id)
+    if camera is not None:
+        camera.state.face_tracker.set_result(track_id, match, match_confidence(match))
+        probe_key = camera.state.probe_keys.pop(track_id, None)
+        if probe_key is not None and match is not None and not isinstance(match, Exception):
+            camera.state.probe_cache.put(probe_key, match)
+
+# Recognition runs on this pool so detection and drawing keep the camera rate;
+# it is shared by every camera, so crops of several feeds are batched together
+recognition_pool = RecognitionPool(
+    recognize_faces,
+    recognition_workers,
+    on_result=deliver_result,
+    max_batch=recognition_batch_size
+)
+metrics.gauge("recognition_queue_depth", "Face crops waiting for or in recognition", function=recognition_pool.queue_depth)
+
+def draw_recognition(frame, x, y, match):
+    if isinstance(match, Exception):
+        # Display error message on frame
+        cv2.putText(frame, "Recognition Error", (x, y-10), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+        return
     
-    for name, embedding in embeddings_dict.items():
-        # Calculate distance based on the selected metric
-        if distance_metric == "cosine":
-            distance = 1 - np.dot(img_embedding, embedding) / (np.linalg.norm(img_embedding) * np.linalg.norm(embedding))
-        elif distance_metric == "euclidean":
-            distance = euclidean_distance(img_embedding, embedding)
-        elif distance_metric == "euclidean_l2":
-            distance = euclidean_distance(img_embedding / np.linalg.norm(img_embedding), embedding / np.linalg.norm(embedding))
-        
-        # Consider it a match if distance is below threshold
-        if distance < threshold:
-            matches.append((name, distance))
+    if match is None:
+        # No matches found in database
+        cv2.putText(frame, "Unknown", (x, y-10), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+        return
     
-    # Return the best match, if any
-    if matches:
-        return min(matches, key=lambda x: x[1])
-    return None
+    name, distance, _ = match
+    
+    # Determine color based on confidence (green for high confidence, red for low)
+    if distance < recognition_threshold:
+        confidence = 1 - (distance / recognition_threshold)
+        color = (0, int(255 * confidence), int(255 * (1 - confidence)))
+        
+        # Display name and confidence on the frame
+        confidence_text = f"{confidence*100:.1f}%"
+        cv2.putText(frame, f"{name} ({confidence_text})", (x, y-10), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
+    else:
+        # If distance is above threshold, show as unknown
+        cv2.putText(frame, "Unknown", (x, y-10), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
 
-def generate_frames():
-    global face_recognition_enabled, face_detector
+def generate_frames(camera):
+    global face_recognition_enabled
+    detection_scheduler = camera.state.detection_scheduler
+    face_tracker = camera.state.face_tracker
+    probe_cache = camera.state.probe_cache
+    probe_keys = camera.state.probe_keys
+    frame_id = 0
     
     while True:
-        if camera is None:
+        stream = camera.stream
+        if stream is None:
             # Return a blank frame when the camera is not active
             blank_frame = np.zeros((480, 640, 3), np.uint8)
             cv2.putText(blank_frame, "Camera Off", (220, 240), cv2.FONT_HERSHEY_COMPLEX, 1, (255, 255, 255), 2)
-            _, buffer = cv2.imencode('.jpg', blank_frame)
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            yield blank_frame
             time.sleep(0.1)
             continue
         
-        success, frame = camera.read()
+        # Take the newest captured frame; frames captured while we were busy are dropped
+        clock = metrics.clock()
+        last_frame_id = frame_id
+        frame_id, success, frame = stream.wait(frame_id)
+        clock = stage_seconds.since(clock, "capture")
+        if last_frame_id and frame_id > last_frame_id + 1:
+            dropped_frames.inc(frame_id - last_frame_id - 1)
         if not success:
             # Return a blank frame on camera read failure
             blank_frame = np.zeros((480, 640, 3), np.uint8)
             cv2.putText(blank_frame, "Camera Error", (220, 240), cv2.FONT_HERSHEY_COMPLEX, 1, (255, 255, 255), 2)
-            _, buffer = cv2.imencode('.jpg', blank_frame)
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            yield blank_frame
             time.sleep(0.1)
             continue
         
         # Flip the frame for a mirror effect
         frame = cv2.flip(frame, 1)
         
-        # Convert frame to grayscale for face detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # Detect faces only on the frames the scheduler picks; in between, reuse the tracked boxes
+        started = time.perf_counter()
+        detected = detection_scheduler.should_detect()
+        if detected:
+            # Convert frame to grayscale for face detection
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            clock = stage_seconds.since(clock, "gray")
+            
+            # Detect faces in the frame
+            faces = detection_scheduler.detect(gray)
+            
+            # Follow faces between frames so each keeps its last recognition result
+            tracks = face_tracker.update(faces, frame)
+        else:
+            tracks = face_tracker.predict(frame)
+        clock = stage_seconds.since(clock, "detect" if detected else "track")
         
-        # Detect faces in the frame
-        faces = face_detector.detectMultiScale(gray, 1.3, 5)
+        # Only perform recognition if it is enabled and we have registered faces
+        recognize = face_recognition_enabled and embedder.is_ready() and len(gallery) > 0
         
-        # Process each detected face
-        for (x, y, w, h) in faces:
+        for track in tracks:
+            x, y, w, h = track.box
+            
+            # Recognize new tracks, or old ones once their result is due for a refresh,
+            # handing a copy of the face ROI to the worker pool without waiting for it
+            if recognize and face_tracker.needs_recognition(track):
+                face_img = frame[y:y+h, x:x+w]
+                probe_key = probe_cache.key(face_img, track.box)
+                cached = probe_cache.get(probe_key)
+                if cached is not None:
+                    # The same face was recognized at this spot moments ago; skip the embedding
+                    face_tracker.mark_submitted(track)
+                    face_tracker.set_result(track.track_id, cached, match_confidence(cached))
+                    recognition_cache.inc(label_value="probe_hit")
+                else:
+                    if recognition_pool.submit((camera.camera_id, track.track_id), face_img.copy()):
+                        face_tracker.mark_submitted(track)
+                        probe_keys[track.track_id] = probe_key
+                    recognition_cache.inc(label_value="miss")
+            elif recognize:
+                recognition_cache.inc(label_value="hit")
+            
             # Draw rectangle around face
             cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
             
-            # If face recognition is enabled, try to identify the face
-            if face_recognition_enabled:
-                try:
-                    # Extract the face ROI
-                    face_roi = frame[y:y+h, x:x+w].copy()
-                    
-                    # Only perform recognition if we have registered faces
-                    if os.listdir(FACE_DATABASE):
-                        # Analyze the face using DeepFace
-                        result = DeepFace.find(
-                            face_roi, 
-                            db_path=FACE_DATABASE,
-                            model_name=face_model,
-                            distance_metric=distance_metric,
-                            detector_backend=face_detector_model,
-                            enforce_detection=False,
-                            align=True
-                        )
-                        
-                        # Check if any matches were found
-                        if not result[0].empty:
-                            # Get the best match
-                            best_match = result[0].iloc[0]
-                            distance = best_match[f"{distance_metric}_distance"]
-                            
-                            # Extract the name from the file path
-                            path = best_match['identity']
-                            name = os.path.basename(os.path.dirname(path))
-                            
-                            # Determine color based on confidence (green for high confidence, red for low)
-                            if distance < recognition_threshold:
-                                confidence = 1 - (distance / recognition_threshold)
-                                color = (0, int(255 * confidence), int(255 * (1 - confidence)))
-                                
-                                # Display name and confidence on the frame
-                                confidence_text = f"{confidence*100:.1f}%"
-                                cv2.putText(frame, f"{name} ({confidence_text})", (x, y-10), 
-                                            cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
-                            else:
-                                # If distance is above threshold, show as unknown
-                                cv2.putText(frame, "Unknown", (x, y-10), 
-                                            cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
-                        else:
-                            # No matches found in database
-                            cv2.putText(frame, "Unknown", (x, y-10), 
-                                        cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
-                except Exception as e:
-                    # Print exception for debugging
-                    print(f"Error during face recognition: {e}")
-                    # Display error message on frame
-                    cv2.putText(frame, "Recognition Error", (x, y-10), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+            # Show the most recent result for this face until a newer one arrives
+            if recognize and track.recognized:
+                draw_recognition(frame, x, y, track.result)
+        
+        active_track_ids = face_tracker.track_ids()
+        recognition_pool.forget([(camera.camera_id, track_id) for track_id in active_track_ids],
+                                owner=camera.camera_id)
+        for track_id in list(probe_keys):
+            if track_id not in active_track_ids:
+                probe_keys.pop(track_id, None)
+        stage_seconds.since(clock, "draw")
         
-        # Convert the frame to JPEG format
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
+        detection_scheduler.frame_done(time.perf_counter() - started, detected)
         
-        # Yield the frame in the MJPEG format
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        frames_total.inc()
+        faces_per_frame.observe(len(tracks))
+        frame_rate.tick()
+        
+        # The camera's encoder thread turns the frame into JPEG, once for all viewers
+        yield frame
+
+# Named cameras, each with a single processing pipeline shared by all of its viewers
+cameras = CameraRegistry(
+    generate_frames,
+    CameraPipeline,
+    stream_settings={
+        'jpeg_quality': stream_jpeg_quality,
+        'scale': stream_scale,
+        'max_fps': stream_max_fps,
+        'jpeg_backend': jpeg_backend
+    },
+    on_encoded=lambda seconds: stage_seconds.observe(seconds, "imencode")
+)
+for camera_id, source in CAMERAS.items():
+    cameras.add(camera_id, source)
+metrics.counter("stream_frames_skipped_total", "Frames a slow viewer skipped to stay on the newest one",
+                function=lambda: sum(camera.broadcaster.skipped_frames for camera in cameras.list()))
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(),
+@app.route('/video_feed/<camera_id>')
+def video_feed(camera_id=DEFAULT_CAMERA):
+    camera = cameras.get(camera_id)
+    if camera is None:
+        return jsonify({'status': 'error', 'message': f'Unknown camera {camera_id}'}), 404
+    return Response(camera.broadcaster.stream(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/ready')
+def ready():
+    # Ready once the model is warm and the gallery is loaded
+    status = embedder.status()
+    status['gallery_loaded'] = gallery.loaded.is_set()
+    status['gallery_size'] = len(gallery)
+    is_ready = status['ready'] and status['gallery_loaded']
+    status['status'] = 'ready' if is_ready else 'loading'
+    return jsonify(status), 200 if is_ready else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus scrape target
+    if not metrics.enabled:
+        return "Metrics are disabled\n", 404, {'Content-Type': 'text/plain'}
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/start_camera', methods=['POST'])
-def start_camera():
-    global camera
-    with lock:
-        if camera is None:
-            # Try to open the camera
-            camera = cv2.VideoCapture(0)
-            if not camera.isOpened():
-                return jsonify({'status': 'error', 'message': 'Failed to open camera'}), 500
-            # Set resolution to 640x480
-            camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+@app.route('/cameras/<camera_id>/start', methods=['POST'])
+def start_camera(camera_id=DEFAULT_CAMERA):
+    camera = cameras.get(camera_id)
+    if camera is None:
+        return jsonify({'status': 'error', 'message': f'Unknown camera {camera_id}'}), 404
+    # Opens the source (at 640x480 for devices) and captures on a background thread
+    if not camera.start():
+        return jsonify({'status': 'error', 'message': 'Failed to open camera'}), 500
     return jsonify({'status': 'success', 'message': 'Camera started'})
 
 @app.route('/stop_camera', methods=['POST'])
-def stop_camera():
-    global camera
-    with lock:
-        if camera is not None:
-            camera.release()
-            camera = None
+@app.route('/cameras/<camera_id>/stop', methods=['POST'])
+def stop_camera(camera_id=DEFAULT_CAMERA):
+    camera = cameras.get(camera_id)
+    if camera is None:
+        return jsonify({'status': 'error', 'message': f'Unknown camera {camera_id}'}), 404
+    camera.stop()
     return jsonify({'status': 'success', 'message': 'Camera stopped'})
 
+@app.route('/cameras', methods=['GET'])
+def list_cameras():
+    return jsonify({'status': 'success', 'cameras': [camera.info() for camera in cameras.list()]})
+
+@app.route('/cameras', methods=['POST'])
+def add_camera():
+    data = request.get_json() or {}
+    camera_id = str(data.get('camera_id', '')).strip()
+    source = data.get('source')
+    
+    if not camera_id or source is None or source == '':
+        return jsonify({'status': 'error', 'message': 'camera_id and source are required'}), 400
+    if isinstance(source, bool) or not isinstance(source, (str, int)):
+        return jsonify({'status': 'error', 'message': 'source must be a device index, path or URL'}), 400
+    
+    if cameras.get(camera_id) is not None:
+        return jsonify({'status': 'error', 'message': f'Camera {camera_id} already exists'}), 409
+    
+    try:
+        camera = cameras.add(
+            camera_id,
+            source,
+            jpeg_quality=data.get('jpeg_quality'),
+            scale=data.get('scale'),
+            max_fps=data.get('max_fps'),
+            jpeg_backend=data.get('jpeg_backend')
+        )
+    except (TypeError, ValueError, ImportError, OSError) as e:
+        # Invalid output settings, unknown JPEG backend, or turbojpeg requested but not installed
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    if data.get('start', True):
+        # A camera that cannot be opened is not kept, so the same id can be added again
+        try:
+            started = camera.start()
+        except Exception as e:
+            cameras.remove(camera_id)
+            return jsonify({'status': 'error', 'message': f'Failed to open {source}: {e}'}), 500
+        if not started:
+            cameras.remove(camera_id)
+            return jsonify({'status': 'error', 'message': f'Failed to open {source}'}), 500
+    return jsonify({'status': 'success', 'camera': camera.info()})
+
+@app.route('/cameras/<camera_id>/settings', methods=['POST'])
+def camera_settings(camera_id):
+    # Output settings can change while the feed is being watched
+    camera = cameras.get(camera_id)
+    if camera is None:
+        return jsonify({'status': 'error', 'message': f'Unknown camera {camera_id}'}), 404
+    
+    data = request.get_json() or {}
+    try:
+        camera.configure(data.get('jpeg_quality'), data.get('scale'), data.get('max_fps'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'status': 'success', 'camera': camera.info()})
+
+@app.route('/cameras/<camera_id>', methods=['DELETE'])
+def remove_camera(camera_id):
+    if not cameras.remove(camera_id):
+        return jsonify({'status': 'error', 'message': f'Unknown camera {camera_id}'}), 404
+    return jsonify({'status': 'success', 'message': f'Camera {camera_id} removed'})
+
 @app.route('/toggle_recognition', methods=['POST'])
 def toggle_recognition():
     global face_recognition_enabled
@@ -211,16 +473,16 @@ def toggle_recognition():
 
 @app.route('/capture_face', methods=['POST'])
 def capture_face():
-    global camera
+    # Get person name (and optionally the camera to capture from) from form data
+    data = request.get_json()
+    person_name = data.get('name', '').strip()
+    camera = cameras.get(data.get('camera_id', DEFAULT_CAMERA))
     
     # Check if camera is active
-    if camera is None:
+    stream = camera.stream if camera is not None else None
+    if stream is None:
         return jsonify({'status': 'error', 'message': 'Camera is not active'}), 400
     
-    # Get person name from form data
-    data = request.get_json()
-    person_name = data.get('name', '').strip()
-    
     # Validate person name
     if not person_name:
         return jsonify({'status': 'error', 'message': 'Person name is required'}), 400
@@ -233,7 +495,7 @@ def capture_face():
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     
     # Capture a frame from the camera
-    ret, frame = camera.read()
+    ret, frame = stream.read()
     if not ret:
         return jsonify({'status': 'error', 'message': 'Failed to capture image'}), 500
     
@@ -245,6 +507,12 @@ def capture_face():
     filepath = os.path.join(person_dir, filename)
     cv2.imwrite(filepath, frame)
     
+    # Add the new face to the live gallery, embedding only this image
+    try:
+        gallery.add(filepath, gallery.represent(frame))
+    except Exception as e:
+        print(f"Error adding {filepath} to gallery: {e}")
+    
     # Return success response with image path
     return jsonify({
         'status': 'success',
@@ -285,6 +553,12 @@ def upload_face():
     # Save the uploaded file
     file.save(filepath)
     
+    # Add the new face to the live gallery, embedding only this image
+    try:
+        gallery.add(filepath)
+    except Exception as e:
+        print(f"Error adding {filepath} to gallery: {e}")
+    
     # Return success response with image path
     return jsonify({
         'status': 'success',
@@ -347,6 +621,9 @@ def delete_face():
         # Delete the file
         os.remove(filepath)
         
+        # Remove its row from the live gallery
+        gallery.remove(filepath)
+        
         # If this was the last image for the person, delete the person directory
         person_dir = os.path.join(FACE_DATABASE, person_name)
         if os.path.exists(person_dir) and not os.listdir(person_dir):
@@ -356,5 +633,151 @@ def delete_face():
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'Error deleting file: {str(e)}'}), 500
 
+# Decodes and detects /recognize uploads; its fixed size bounds the work of concurrent requests
+recognize_executor = ThreadPoolExecutor(max_workers=recognize_workers, thread_name_prefix='recognize')
+detector_local = threading.local()
+
+def detect_image_faces(name, data):
+    # Decode one uploaded image and return (name, boxes, face crops); boxes is None if it cannot be read
+    if data is None:
+        return name, None, []
+    
+    # HAAR_CASCADE loaded once per worker thread; a cascade must not be shared between threads
+    detector = getattr(detector_local, 'cascade', None)
+    if detector is None:
+        detector = detector_local.cascade = cv2.CascadeClassifier(HAAR_CASCADE)
+    
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return name, None, []
+    
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    boxes = [tuple(int(v) for v in face) for face in detector.detectMultiScale(gray, 1.3, 5)]
+    return name, boxes, [img[y:y+h, x:x+w] for x, y, w, h in boxes]
+
+def uploaded_images(uploads):
+    # Yield (name, bytes) for every uploaded (filename, saved path), reading zip archives member by member;
+    # bytes is None for files that are not images or archives that cannot be opened
+    for filename, path in uploads:
+        if filename.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(path) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir() or not allowed_file(info.filename):
+                            continue
+                        if info.file_size > recognize_max_image:
+                            # Never decompress more than the limit, e.g. from a zip bomb
+                            print(f"Skipping {info.filename} from {filename}: {info.file_size} bytes uncompressed")
+                            yield info.filename, None
+                            continue
+                        try:
+                            data = archive.read(info)
+                        except Exception as e:
+                            # Encrypted, unsupported compression or corrupt member
+                            print(f"Error reading {info.filename} from {filename}: {e}")
+                            data = None
+                        yield info.filename, data
+            except zipfile.BadZipFile:
+                yield filename, None
+        elif allowed_file(filename):
+            with open(path, 'rb') as f:
+                yield filename, f.read()
+        else:
+            yield filename, None
+
+def save_upload(filename, save):
+    # Spool an upload to TEMP_DIR so it outlives the request while results stream back
+    fd, path = tempfile.mkstemp(dir=TEMP_DIR, suffix=os.path.splitext(filename)[1])
+    with os.fdopen(fd, 'wb') as f:
+        save(f)
+    return filename, path
+
+def recognize_image_batch(batch, top_k=1):
+    # Detect faces in the images in parallel, then embed the faces of the batch in batched forward passes
+    detected = list(recognize_executor.map(lambda item: detect_image_faces(*item), batch))
+    crops = [crop for _, _, image_crops in detected for crop in image_crops]
+    
+    try:
+        # Embedding runs on the same fixed executor, so concurrent requests cannot add forward passes,
+        # and at most recognition_batch_size crops go through the model at once
+        matches = []
+        for start in range(0, len(crops), recognition_batch_size):
+            chunk = crops[start:start + recognition_batch_size]
+            embeddings = recognize_executor.submit(embedder.represent_batch, chunk).result()
+            matches.extend(gallery.search(embeddings, k=top_k))
+    except Exception as e:
+        for name, _, _ in detected:
+            yield {'image': name, 'error': f'Recognition failed: {e}'}
+        return
+    
+    position = 0
+    for name, boxes, _ in detected:
+        if boxes is None:
+            yield {'image': name, 'error': 'Could not read image'}
+            continue
+        
+        faces = []
+        for box in boxes:
+            face_matches = matches[position]
+            position += 1
+            best = face_matches[0] if face_matches else None
+            faces.append({
+                'box': list(box),
+                'identity': best[0] if best is not None and best[1] < recognition_threshold else None,
+                'distance': best[1] if best is not None else None,
+                'confidence': match_confidence(best),
+                'matches': [{'name': match_name, 'distance': distance} for match_name, distance, _ in face_matches]
+            })
+        yield {'image': name, 'faces': faces}
+
+def recognize_images(images, top_k=1):
+    # Yield one result per (name, bytes) image, working through them recognition_batch_size at a time
+    batch = []
+    for image in images:
+        batch.append(image)
+        if len(batch) >= recognition_batch_size:
+            yield from recognize_image_batch(batch, top_k)
+            batch = []
+    if batch:
+        yield from recognize_image_batch(batch, top_k)
+
+@app.route('/recognize', methods=['POST'])
+def recognize():
+    # Recognize every face in uploaded images (multipart files and/or zip archives)
+    if not embedder.is_ready() or not gallery.loaded.is_set():
+        return jsonify({'status': 'error', 'message': 'Model or gallery is still loading'}), 503
+    
+    # Photo dumps are larger than the app-wide upload limit
+    request.max_content_length = recognize_max_upload
+    
+    uploads = [save_upload(file.filename, file.save)
+               for key in request.files for file in request.files.getlist(key) if file.filename]
+    if not uploads and request.mimetype in ('application/zip', 'application/x-zip-compressed'):
+        # A zip archive posted as the raw request body
+        uploads = [save_upload('upload.zip', lambda f: shutil.copyfileobj(request.stream, f))]
+    if not uploads:
+        return jsonify({'status': 'error', 'message': 'No images uploaded'}), 400
+    
+    top_k = max(1, request.args.get('top_k', 1, type=int))
+    
+    def generate():
+        # Results are written as soon as each batch is done, so large uploads stream back
+        yield '{"status": "success", "results": ['
+        for i, result in enumerate(recognize_images(uploaded_images(uploads), top_k)):
+            yield (', ' if i else '') + json.dumps(result)
+        yield ']}'
+    
+    def remove_uploads():
+        for _, path in uploads:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    response = Response(generate(), mimetype='application/json')
+    # Runs when the server closes the response, even if it was never iterated
+    response.call_on_close(remove_uploads)
+    return response
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001) 
\ No newline at end of file
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+ASGI server mode
+Serves the routes of app.py or face_recognition_app.py on asyncio: the MJPEG feeds are async
+subscribers of the camera broadcasters, and every other route runs the Flask app on a small,
+fixed pool of threads
+
+    python asgi_server.py --app app --port 5001 --api-threads 8
+
+Needs the optional starlette and uvicorn packages (and a2wsgi, if installed, to bridge Flask).
+Viewers no longer cost a thread each: a camera runs one producer and one encoder thread no
+matter how many feeds are open, and detection, recognition and encoding stay off the event loop.
+"""
+
+import argparse
+import importlib
+from contextlib import asynccontextmanager
+
+try:
+    import anyio
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Mount, Route
+except ImportError:
+    Starlette = None
+
+try:
+    from a2wsgi import WSGIMiddleware
+    a2wsgi_bridge = True  # Runs Flask on its own thread pool rather than anyio's
+except ImportError:
+    a2wsgi_bridge = False
+    try:
+        from starlette.middleware.wsgi import WSGIMiddleware
+    except ImportError:
+        WSGIMiddleware = None
+
+MJPEG_MEDIA_TYPE = 'multipart/x-mixed-replace; boundary=frame'
+
+
+def create_app(module, api_threads=8):
+    """Starlette app serving the feeds of module natively and everything else through its Flask app"""
+    if Starlette is None or WSGIMiddleware is None:
+        raise ImportError("The ASGI server mode needs starlette and uvicorn: pip install starlette uvicorn")
+
+    def feed_response(broadcaster):
+        return StreamingResponse(broadcaster.astream(), media_type=MJPEG_MEDIA_TYPE)
+
+    if hasattr(module, 'cameras'):
+        # app.py: one broadcaster per named camera
+        async def video_feed(request):
+            camera_id = request.path_params.get('camera_id', module.DEFAULT_CAMERA)
+            camera = module.cameras.get(camera_id)
+            if camera is None:
+                return JSONResponse({'status': 'error', 'message': f'Unknown camera {camera_id}'}, status_code=404)
+            return feed_response(camera.broadcaster)
+    else:
+        # face_recognition_app.py: a single broadcaster
+        async def video_feed(request):
+            return feed_response(module.broadcaster)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Flask routes and other blocking calls share this many worker threads
+        anyio.to_thread.current_default_thread_limiter().total_tokens = api_threads
+        yield
+
+    routes = [Route('/video_feed', video_feed)]
+    if hasattr(module, 'cameras'):
+        routes.append(Route('/video_feed/{camera_id}', video_feed))
+    # Either bridge runs Flask on at most api_threads threads
+    flask_app = WSGIMiddleware(module.app, workers=api_threads) if a2wsgi_bridge else WSGIMiddleware(module.app)
+    routes.append(Mount('/', app=flask_app))
+    return Starlette(routes=routes, lifespan=lifespan)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the face recognition app on an ASGI server")
+    parser.add_argument('--app', default="app", help="app or face_recognition_app")
+    parser.add_argument('--host', default="0.0.0.0")
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--api-threads', type=int, default=8, help="Threads running the non-streaming routes")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    module = importlib.import_module(args.app)
+    uvicorn.run(create_app(module, args.api_threads), host=args.host, port=args.port)
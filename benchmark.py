@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark
+Replays a recorded video or image sequence through the frame pipelines, and measures
+matching cost of every gallery backend on synthetic galleries
+
+    python benchmark.py --source clip.mp4 --pipeline app --pipeline-gallery-size 1000
+    python benchmark.py --matching-only --sizes 10,1000,100000 --backends exact,ivf,prototype
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import tracemalloc
+import numpy as np
+import cv2
+from camera_stream import IMAGE_SEQUENCE_EXTENSIONS
+
+
+class ReplayStream:
+    """CameraStream stand-in that hands out preloaded frames of a video file or image directory
+
+    Every wait() returns the next frame at once, so the pipeline runs as fast as it can.
+    """
+
+    def __init__(self, source, max_frames=None, loop=True, width=None, height=None):
+        self.frames = self._load(source, max_frames, width, height)
+        self.loop = loop
+        self.frame_id = 0
+        self.running = False
+
+    @staticmethod
+    def _load(source, max_frames, width, height):
+        frames = []
+        if os.path.isdir(source):
+            for filename in sorted(os.listdir(source)):
+                if max_frames and len(frames) >= max_frames:
+                    break
+                if filename.lower().endswith(IMAGE_SEQUENCE_EXTENSIONS):
+                    frame = cv2.imread(os.path.join(source, filename))
+                    if frame is not None:
+                        frames.append(frame)
+        else:
+            capture = cv2.VideoCapture(source)
+            while not max_frames or len(frames) < max_frames:
+                success, frame = capture.read()
+                if not success:
+                    break
+                frames.append(frame)
+            capture.release()
+
+        if not frames:
+            raise ValueError(f"No frames could be read from {source}")
+        if width and height:
+            frames = [cv2.resize(frame, (width, height)) for frame in frames]
+        return frames
+
+    def isOpened(self):
+        return True
+
+    def start(self):
+        self.running = True
+        return self
+
+    def wait(self, last_frame_id=0, timeout=1.0):
+        """Return (frame_id, success, frame) for the next frame of the recording"""
+        index = self.frame_id
+        if index >= len(self.frames):
+            if not self.loop:
+                return last_frame_id, False, None
+            index %= len(self.frames)
+        self.frame_id += 1
+        return self.frame_id, True, self.frames[index]
+
+    def read(self, timeout=1.0):
+        _, success, frame = self.wait(self.frame_id, timeout)
+        return success, frame
+
+    def release(self):
+        self.running = False
+
+
+def synthetic_embeddings(identities, images_per_identity, dim, noise=0.3, seed=0):
+    """Clustered random embeddings labelled like <db>/<name>/<file>, plus the identity centres"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((identities, dim)).astype(np.float32)
+    embeddings = np.repeat(centres, images_per_identity, axis=0)
+    embeddings += noise * rng.standard_normal(embeddings.shape).astype(np.float32)
+    labels = [os.path.join("synthetic", f"person{i}", f"{j}.jpg")
+              for i in range(identities) for j in range(images_per_identity)]
+    return embeddings, labels, centres
+
+
+def synthetic_templates(identities, size=(100, 100), seed=0):
+    """Normalized random templates, one per identity, as a TemplateGallery would hold them"""
+    rng = np.random.default_rng(seed)
+    templates = rng.standard_normal((identities, size[0] * size[1])).astype(np.float32)
+    templates -= templates.mean(axis=1, keepdims=True)
+    templates /= np.linalg.norm(templates, axis=1, keepdims=True)
+    return templates, [f"person{i}" for i in range(identities)]
+
+
+def synthetic_template_gallery(identities, seed=0):
+    """TemplateGallery over an empty directory, filled with synthetic templates"""
+    from template_gallery import TemplateGallery
+
+    gallery = TemplateGallery(tempfile.mkdtemp(prefix="benchmark_templates_"))
+    gallery.reload()  # Records the directory signature so the synthetic rows are not reloaded away
+    gallery.templates, gallery.names = synthetic_templates(identities, gallery.size, seed)
+    return gallery
+
+
+def percentiles(seconds):
+    seconds = np.asarray(seconds)
+    if len(seconds) == 0:
+        return {'p50_ms': None, 'p99_ms': None}
+    return {
+        'p50_ms': round(float(np.percentile(seconds, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(seconds, 99)) * 1000, 3)
+    }
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def benchmark_backend(backend, embeddings, labels, centres, probes, args):
+    """Build one index over the synthetic gallery and time batched probe searches"""
+    from gallery import identity_name
+    from ann_index import build_index
+    from template_gallery import normalize_template
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    if backend == "template":
+        gallery = synthetic_template_gallery(len(centres), args.seed)
+    else:
+        options = {}
+        if backend == "ivf":
+            options = {'nprobe': args.nprobe}
+        elif backend == "prototype":
+            options = {'group_of': identity_name, 'method': args.prototype_method}
+        index = build_index(backend, embeddings, labels, args.metric, min_size=0, **options)
+    build_seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = []
+    correct = 0
+    for start in range(0, len(probes), args.batch_size):
+        batch, expected = probes[start:start + args.batch_size]
+        started = time.perf_counter()
+        if backend == "template":
+            # Template matching scores one face at a time, as face_recognition_app does
+            for template, name in zip(batch, expected):
+                scores = gallery.templates @ normalize_template(template.reshape(gallery.size))
+                correct += gallery.names[int(np.argmax(scores))] == name
+        else:
+            for matches, name in zip(index.search(batch, k=1), expected):
+                correct += bool(matches) and identity_name(matches[0][0]) == name
+        latencies.append((time.perf_counter() - started) / len(batch))
+
+    return {
+        'backend': backend,
+        'build_s': round(build_seconds, 3),
+        'build_peak_mb': round(peak / (1024 * 1024), 1),
+        'per_probe': percentiles(latencies),
+        'accuracy': round(correct / max(1, probes.count), 4),
+        'max_rss_mb': max_rss_mb()
+    }
+
+
+class ProbeBatches:
+    """Noisy copies of random identity centres (or templates), served in batches with their expected names"""
+
+    def __init__(self, vectors, names, count, noise, seed):
+        rng = np.random.default_rng(seed + 1)
+        picks = rng.integers(0, len(vectors), count)
+        self.vectors = vectors[picks] + noise * rng.standard_normal((count, vectors.shape[1])).astype(np.float32)
+        self.names = [names[i] for i in picks]
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, window):
+        return self.vectors[window], self.names[window]
+
+
+def benchmark_matching(args):
+    results = []
+    for size in args.sizes:
+        embeddings, labels, centres = synthetic_embeddings(size, args.images_per_identity, args.dim,
+                                                           args.noise, args.seed)
+        names = [f"person{i}" for i in range(size)]
+        probes = ProbeBatches(centres, names, args.probes, args.noise, args.seed)
+
+        for backend in args.backends:
+            if backend == "template":
+                templates, _ = synthetic_templates(size, seed=args.seed)
+                backend_probes = ProbeBatches(templates, names, args.probes, args.noise / 100, args.seed)
+                result = benchmark_backend(backend, None, None, centres, backend_probes, args)
+            else:
+                result = benchmark_backend(backend, embeddings, labels, centres, probes, args)
+            result['identities'] = size
+            result['rows'] = size if backend == "template" else len(labels)
+            results.append(result)
+            print(f"matching  {backend:9s} identities={size:<7d} build={result['build_s']:.3f}s "
+                  f"peak={result['build_peak_mb']}MB p50={result['per_probe']['p50_ms']}ms "
+                  f"p99={result['per_probe']['p99_ms']}ms accuracy={result['accuracy']}")
+    return results
+
+
+def load_pipeline(name, gallery_size, args):
+    """Import one of the apps and swap its gallery for a synthetic one of gallery_size identities"""
+    if name == "app":
+        import app as module
+
+        # Let the app finish its own model warm-up and gallery load before replacing the gallery
+        module.embedder.ready.wait()
+        module.gallery.loaded.wait()
+
+        from gallery import EmbeddingGallery
+        dim = module.embedder.represent_batch([np.zeros((112, 112, 3), dtype=np.uint8)]).shape[1]
+        embeddings, labels, _ = synthetic_embeddings(gallery_size, args.images_per_identity, dim,
+                                                     args.noise, args.seed)
+        gallery = EmbeddingGallery(module.embedder, module.distance_metric, index_type=module.gallery_index,
+                                   index_options=module.gallery_index_options[module.gallery_index])
+        gallery._replace(embeddings, labels)
+        gallery.loaded.set()
+        module.gallery = gallery
+        module.face_recognition_enabled = True
+    else:
+        import face_recognition_app as module
+        module.face_templates = synthetic_template_gallery(gallery_size, args.seed)
+        module.camera_active = True
+    return module
+
+
+def benchmark_pipeline(name, args):
+    module = load_pipeline(name, args.pipeline_gallery_size, args)
+    stream = ReplayStream(args.source, args.max_frames, True, args.width, args.height).start()
+
+    if name == "app":
+        # Replay into the default camera of the registry
+        camera = module.cameras.get(module.DEFAULT_CAMERA)
+        camera.stream = stream
+        frames = module.generate_frames(camera)
+        encode = camera._encode
+    else:
+        module.camera = stream
+        frames = module.generate_frames()
+        encode = module.encode_frame
+    try:
+        for _ in range(args.warmup):
+            encode(next(frames))
+
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(args.frames):
+            frame_started = time.perf_counter()
+            # The servers encode on a separate thread; here it runs inline so it is part of the frame time
+            encode(next(frames))
+            latencies.append(time.perf_counter() - frame_started)
+        elapsed = time.perf_counter() - started
+    finally:
+        frames.close()
+        if name == "app":
+            camera.stream = None
+        else:
+            module.camera = None
+
+    # Mean time of each stage, from the app's own /metrics histograms
+    stages = {}
+    for stage, values in module.stage_seconds.series.items():
+        count = sum(values[:-1])
+        if count:
+            stages[stage] = round(values[-1] / count * 1000, 3)
+
+    result = {
+        'pipeline': name,
+        'gallery_identities': args.pipeline_gallery_size,
+        'frames': args.frames,
+        'fps': round(args.frames / elapsed, 2),
+        'per_frame': percentiles(latencies),
+        'stage_mean_ms': stages,
+        'max_rss_mb': max_rss_mb()
+    }
+    print(f"pipeline  {name:22s} fps={result['fps']} p50={result['per_frame']['p50_ms']}ms "
+          f"p99={result['per_frame']['p99_ms']}ms rss={result['max_rss_mb']}MB stages={stages}")
+    return result
+
+
+def parse_args(argv=None):
+    def int_list(value):
+        return [int(v) for v in value.split(',') if v]
+
+    def str_list(value):
+        return [v for v in value.split(',') if v]
+
+    parser = argparse.ArgumentParser(description="Benchmark the frame pipelines and gallery matching backends")
+    parser.add_argument('--source', help="Video file or image directory replayed in place of the camera")
+    parser.add_argument('--pipeline', type=str_list, default=["app", "face_recognition_app"],
+                        help="Comma-separated pipelines to replay: app, face_recognition_app")
+    parser.add_argument('--frames', type=int, default=300, help="Frames measured per pipeline")
+    parser.add_argument('--warmup', type=int, default=10, help="Frames run before measuring")
+    parser.add_argument('--max-frames', type=int, default=1000, help="Most frames preloaded from the source")
+    parser.add_argument('--width', type=int, help="Resize replayed frames to this width")
+    parser.add_argument('--height', type=int, help="Resize replayed frames to this height")
+    parser.add_argument('--pipeline-gallery-size', type=int, default=1000, help="Synthetic identities behind each pipeline")
+    parser.add_argument('--matching-only', action='store_true', help="Skip the pipelines")
+    parser.add_argument('--skip-matching', action='store_true', help="Skip the matching backends")
+    parser.add_argument('--sizes', type=int_list, default=[10, 1000, 10000], help="Comma-separated gallery sizes (identities)")
+    parser.add_argument('--backends', type=str_list, default=["exact", "ivf", "prototype", "template"],
+                        help="Comma-separated backends: exact, ivf, prototype, template")
+    parser.add_argument('--images-per-identity', type=int, default=1)
+    parser.add_argument('--dim', type=int, default=512, help="Synthetic embedding size")
+    parser.add_argument('--metric', default="cosine", help="cosine, euclidean or euclidean_l2")
+    parser.add_argument('--noise', type=float, default=0.3, help="Spread of synthetic embeddings around their identity")
+    parser.add_argument('--probes', type=int, default=1000, help="Probe faces searched per backend")
+    parser.add_argument('--batch-size', type=int, default=16, help="Probes searched per call, like a recognition batch")
+    parser.add_argument('--nprobe', type=int, default=8, help="IVF buckets scanned per probe")
+    parser.add_argument('--prototype-method', default="mean", help="mean or medoids")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    if not args.matching_only and not args.source:
+        parser.error("--source is required unless --matching-only is given")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {'matching': [], 'pipelines': []}
+
+    if not args.skip_matching:
+        results['matching'] = benchmark_matching(args)
+    if not args.matching_only:
+        for name in args.pipeline:
+            results['pipelines'].append(benchmark_pipeline(name, args))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
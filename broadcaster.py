@@ -0,0 +1,179 @@
+"""
+MJPEG frame broadcaster
+Runs a single producer per camera and fans every encoded frame out to all viewers
+"""
+
+import time
+import asyncio
+import threading
+
+
+def mjpeg_part(jpeg):
+    """Wrap JPEG bytes as one part of a multipart/x-mixed-replace stream"""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+
+
+class FrameBroadcaster:
+    """Shares the JPEG frames of one producer generator between any number of subscribers
+
+    With an encode function the producer yields raw frames, and a separate encoder thread
+    JPEG-encodes the newest one while the producer works on the next; frames produced faster
+    than they can be encoded are skipped rather than queued, so each one is encoded at most once.
+    """
+
+    def __init__(self, source, encode=None, max_fps=None):
+        # source() returns a generator of JPEG bytes (or of frames, with encode); it only runs while someone is watching
+        self.source = source
+        self.encode = encode  # encode(frame) returns JPEG bytes
+        self.max_fps = max_fps  # Upper bound on produced frames per second
+        self.condition = threading.Condition()
+        self.jpeg = None
+        self.frame_id = 0
+        self.subscribers = 0
+        self.skipped_frames = 0  # Frames some subscriber never sent because a newer one was ready
+        self.thread = None
+        # (loop, asyncio.Event) of every async subscriber, set whenever a frame is published
+        self.async_waiters = set()
+
+        # Newest raw frame waiting for the encoder thread
+        self.raw_condition = threading.Condition()
+        self.raw_frame = None
+        self.raw_id = 0
+
+    def _ensure_producer(self):
+        # Called with the condition held
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._produce, daemon=True)
+            self.thread.start()
+
+    def _publish(self, jpeg):
+        with self.condition:
+            self.jpeg = jpeg
+            self.frame_id += 1
+            self.condition.notify_all()
+            waiters = list(self.async_waiters)
+
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The subscriber's event loop has closed
+                pass
+
+    def _encode_frames(self, stopped):
+        last_raw_id = self.raw_id
+        while True:
+            with self.raw_condition:
+                self.raw_condition.wait_for(lambda: self.raw_id != last_raw_id or stopped.is_set())
+                if self.raw_id == last_raw_id:
+                    return
+                last_raw_id = self.raw_id
+                frame = self.raw_frame
+
+            try:
+                self._publish(self.encode(frame))
+            except Exception as e:
+                print(f"Error encoding frame: {e}")
+
+    def _produce(self):
+        frames = self.source()
+        stopped = threading.Event()
+        if self.encode is not None:
+            threading.Thread(target=self._encode_frames, args=(stopped,), daemon=True).start()
+
+        next_frame_at = time.monotonic()
+        try:
+            for frame in frames:
+                if self.encode is None or isinstance(frame, bytes):
+                    # Already encoded, e.g. a placeholder frame
+                    self._publish(frame)
+                else:
+                    with self.raw_condition:
+                        self.raw_frame = frame
+                        self.raw_id += 1
+                        self.raw_condition.notify_all()
+
+                with self.condition:
+                    # Stop producing once the last viewer has gone
+                    if self.subscribers == 0:
+                        self.thread = None
+                        return
+
+                # Hold the producer back to the frame-rate cap instead of spinning through frames
+                if self.max_fps:
+                    next_frame_at += 1.0 / self.max_fps
+                    delay = next_frame_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_frame_at = time.monotonic()
+        finally:
+            stopped.set()
+            with self.raw_condition:
+                self.raw_condition.notify_all()
+            frames.close()
+            with self.condition:
+                if self.thread is threading.current_thread():
+                    self.thread = None
+
+    def stream(self):
+        """Generator of multipart MJPEG chunks; slow subscribers skip straight to the newest frame"""
+        with self.condition:
+            self.subscribers += 1
+            self._ensure_producer()
+
+        last_frame_id = 0
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.frame_id != last_frame_id, timeout=1.0)
+                    if self.frame_id == last_frame_id:
+                        # Restart the producer if it stopped while we were still watching
+                        self._ensure_producer()
+                        continue
+                    if last_frame_id:
+                        self.skipped_frames += self.frame_id - last_frame_id - 1
+                    last_frame_id = self.frame_id
+                    jpeg = self.jpeg
+
+                yield mjpeg_part(jpeg)
+        finally:
+            with self.condition:
+                self.subscribers -= 1
+
+    async def astream(self):
+        """Async generator of multipart MJPEG chunks; waits on the event loop instead of holding a thread"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self.condition:
+            self.subscribers += 1
+            self.async_waiters.add(waiter)
+            self._ensure_producer()
+
+        last_frame_id = 0
+        try:
+            while True:
+                event.clear()
+                with self.condition:
+                    frame_id = self.frame_id
+                    jpeg = self.jpeg
+
+                if frame_id == last_frame_id:
+                    try:
+                        await asyncio.wait_for(event.wait(), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        # Restart the producer if it stopped while we were still watching
+                        with self.condition:
+                            self._ensure_producer()
+                    continue
+
+                if last_frame_id:
+                    with self.condition:
+                        self.skipped_frames += frame_id - last_frame_id - 1
+                last_frame_id = frame_id
+                yield mjpeg_part(jpeg)
+        finally:
+            with self.condition:
+                self.subscribers -= 1
+                self.async_waiters.discard(waiter)
@@ -0,0 +1,164 @@
+"""
+Threaded camera capture
+Reads a video source on a background thread and keeps only the newest frame
+"""
+
+import os
+import time
+import threading
+import cv2
+
+IMAGE_SEQUENCE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+STREAM_URL_PREFIXES = ('rtsp://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://')
+
+
+def parse_source(source):
+    """Device index for "0", "1", ...; any other source (file, directory, URL) unchanged"""
+    if isinstance(source, str) and source.strip().isdigit():
+        return int(source)
+    return source
+
+
+def is_live_source(source):
+    """Devices and stream URLs produce frames in real time; files and image directories do not"""
+    source = parse_source(source)
+    return isinstance(source, int) or source.lower().startswith(STREAM_URL_PREFIXES)
+
+
+class ImageSequenceCapture:
+    """cv2.VideoCapture look-alike that reads the images of a directory in file-name order"""
+
+    def __init__(self, directory, fps=10):
+        self.paths = [os.path.join(directory, filename) for filename in sorted(os.listdir(directory))
+                      if filename.lower().endswith(IMAGE_SEQUENCE_EXTENSIONS)]
+        self.fps = fps
+        self.position = 0
+
+    def isOpened(self):
+        return len(self.paths) > 0
+
+    def read(self):
+        while self.position < len(self.paths):
+            frame = cv2.imread(self.paths[self.position])
+            self.position += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.paths)
+        return 0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(value)
+            return True
+        return False
+
+    def release(self):
+        self.paths = []
+
+
+def open_capture(source):
+    """cv2.VideoCapture for a device index, video file or stream URL; ImageSequenceCapture for a directory"""
+    source = parse_source(source)
+    if isinstance(source, str) and os.path.isdir(source):
+        return ImageSequenceCapture(source)
+    return cv2.VideoCapture(source)
+
+
+class CameraStream:
+    """Video source wrapper whose reads never block on device I/O
+
+    source is a device index, a video file, an image directory or a stream URL. Files and
+    image directories play at their own frame rate and loop, standing in for a live camera.
+    """
+
+    def __init__(self, source=0, width=640, height=480, loop=True):
+        self.source = source
+        self.capture = open_capture(source)
+        self.live = is_live_source(source)
+        self.loop = loop
+        if width and height and self.live:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+        # Recorded sources are paced to their frame rate instead of being read as fast as possible
+        self.frame_interval = None
+        if not self.live:
+            fps = self.capture.get(cv2.CAP_PROP_FPS) if self.capture.isOpened() else 0
+            self.frame_interval = 1.0 / (fps if fps and fps > 0 else 25)
+
+        # Latest-frame buffer: a single slot that every capture overwrites
+        self.condition = threading.Condition()
+        self.success = False
+        self.frame = None
+        self.frame_id = 0
+
+        self.running = False
+        self.thread = None
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def start(self):
+        """Start the capture thread"""
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._update, daemon=True)
+        self.thread.start()
+        return self
+
+    def _update(self):
+        next_frame_at = time.monotonic()
+        while self.running:
+            success, frame = self.capture.read()
+            if not success and self.loop and not self.live:
+                # Restart a recording from its first frame
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                success, frame = self.capture.read()
+
+            # Overwrite the slot; frames nobody picked up in time are simply dropped
+            with self.condition:
+                self.success = success
+                self.frame = frame if success else None
+                self.frame_id += 1
+                self.condition.notify_all()
+
+            if not success:
+                time.sleep(0.1)
+            elif self.frame_interval:
+                next_frame_at += self.frame_interval
+                delay = next_frame_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame_at = time.monotonic()
+
+    def wait(self, last_frame_id=0, timeout=1.0):
+        """Wait for a frame newer than last_frame_id and return (frame_id, success, frame)"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame_id > last_frame_id or not self.running, timeout)
+            if self.frame_id <= last_frame_id:
+                return last_frame_id, False, None
+            return self.frame_id, self.success, self.frame
+
+    def read(self, timeout=1.0):
+        """Return (success, frame) for the newest frame, like cv2.VideoCapture.read"""
+        with self.condition:
+            if self.frame_id == 0:
+                self.condition.wait_for(lambda: self.frame_id > 0 or not self.running, timeout)
+            return self.success, self.frame
+
+    def release(self):
+        """Stop the capture thread and release the device"""
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+        self.capture.release()
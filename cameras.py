@@ -0,0 +1,155 @@
+"""
+Named camera registry
+Each camera has its own video source, pipeline state and broadcaster; the recognition workers
+and the gallery stay shared between all of them
+"""
+
+import math
+import time
+import threading
+from camera_stream import CameraStream
+from broadcaster import FrameBroadcaster
+from jpeg_encoder import JpegEncoder
+
+
+def check_stream_settings(jpeg_quality=None, scale=None, max_fps=None):
+    """Validated (jpeg_quality, scale, max_fps); None means unchanged, and bad values raise ValueError"""
+    if jpeg_quality is not None:
+        jpeg_quality = int(jpeg_quality)
+        if not 1 <= jpeg_quality <= 100:
+            raise ValueError(f"jpeg_quality must be between 1 and 100, got {jpeg_quality}")
+    if scale is not None:
+        scale = float(scale)
+        if not (math.isfinite(scale) and scale > 0):
+            raise ValueError(f"scale must be a positive number, got {scale}")
+    if max_fps is not None:
+        max_fps = float(max_fps)
+        if not (math.isfinite(max_fps) and max_fps >= 0):
+            raise ValueError(f"max_fps must be 0 or more, got {max_fps}")
+    return jpeg_quality, scale, max_fps
+
+
+class Camera:
+    """One named video source, started and stopped independently of the others"""
+
+    def __init__(self, camera_id, source, pipeline, state=None, width=640, height=480,
+                 jpeg_quality=80, scale=1.0, max_fps=None, jpeg_backend="auto", on_encoded=None):
+        self.camera_id = camera_id
+        self.source = source
+        self.width = width
+        self.height = height
+        # Per-camera pipeline state, e.g. its own tracker and detection schedule
+        self.state = state
+        self.stream = None
+        self.lock = threading.Lock()
+
+        # Output settings of this feed; encoding runs once per produced frame, on its own thread
+        jpeg_quality, scale, max_fps = check_stream_settings(jpeg_quality, scale, max_fps)
+        self.encoder = JpegEncoder(jpeg_quality, scale, jpeg_backend)
+        self.on_encoded = on_encoded  # on_encoded(seconds) after every encoded frame
+
+        # pipeline(camera) is a generator of frames; it only runs while someone is watching
+        self.broadcaster = FrameBroadcaster(lambda: pipeline(self), self._encode, max_fps or None)
+
+    def _encode(self, frame):
+        started = time.perf_counter()
+        jpeg = self.encoder.encode(frame)
+        if self.on_encoded is not None:
+            self.on_encoded(time.perf_counter() - started)
+        return jpeg
+
+    def configure(self, jpeg_quality=None, scale=None, max_fps=None):
+        """Change the output settings of a running feed; max_fps 0 removes the cap
+
+        Every value is checked before any is applied, so a rejected request changes nothing.
+        """
+        jpeg_quality, scale, max_fps = check_stream_settings(jpeg_quality, scale, max_fps)
+        if jpeg_quality is not None:
+            self.encoder.quality = jpeg_quality
+        if scale is not None:
+            self.encoder.scale = scale
+        if max_fps is not None:
+            self.broadcaster.max_fps = max_fps or None
+
+    @property
+    def running(self):
+        return self.stream is not None
+
+    def start(self):
+        """Open the source and start capturing; returns False if it cannot be opened"""
+        with self.lock:
+            if self.stream is None:
+                stream = CameraStream(self.source, self.width, self.height)
+                if not stream.isOpened():
+                    stream.release()
+                    return False
+                # Capture on a background thread that keeps only the newest frame
+                self.stream = stream.start()
+        return True
+
+    def stop(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.release()
+                self.stream = None
+
+    def info(self):
+        return {
+            'camera_id': self.camera_id,
+            'source': str(self.source),
+            'running': self.running,
+            'viewers': self.broadcaster.subscribers,
+            'max_fps': self.broadcaster.max_fps,
+            **self.encoder.settings()
+        }
+
+
+class CameraRegistry:
+    """Cameras by id, all running the same pipeline function"""
+
+    def __init__(self, pipeline, make_state=None, width=640, height=480, stream_settings=None, on_encoded=None):
+        self.pipeline = pipeline
+        # make_state(camera_id) returns the per-camera state handed to the pipeline
+        self.make_state = make_state
+        self.width = width
+        self.height = height
+        # Default jpeg_quality / scale / max_fps / jpeg_backend of new cameras
+        self.stream_settings = stream_settings or {}
+        self.on_encoded = on_encoded
+        self.lock = threading.Lock()
+        self.cameras = {}
+
+    def add(self, camera_id, source, **stream_settings):
+        """Register a camera without starting it; stream_settings override the registry defaults"""
+        camera_id = str(camera_id)
+        settings = dict(self.stream_settings)
+        settings.update({key: value for key, value in stream_settings.items() if value is not None})
+        with self.lock:
+            if camera_id in self.cameras:
+                raise ValueError(f"Camera {camera_id} already exists")
+            state = self.make_state(camera_id) if self.make_state is not None else None
+            camera = Camera(camera_id, source, self.pipeline, state, self.width, self.height,
+                            on_encoded=self.on_encoded, **settings)
+            self.cameras[camera_id] = camera
+        return camera
+
+    def get(self, camera_id):
+        with self.lock:
+            return self.cameras.get(str(camera_id))
+
+    def remove(self, camera_id):
+        """Stop and unregister a camera, returning False if it did not exist"""
+        with self.lock:
+            camera = self.cameras.pop(str(camera_id), None)
+        if camera is None:
+            return False
+        camera.stop()
+        return True
+
+    def list(self):
+        with self.lock:
+            return list(self.cameras.values())
+
+    def stop_all(self):
+        for camera in self.list():
+            camera.stop()
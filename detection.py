@@ -0,0 +1,69 @@
+"""
+Face detection scheduling
+Runs the Haar cascade every N frames (fixed or adapted to a target FPS), optionally on a downscaled frame
+"""
+
+import math
+import time
+import cv2
+
+
+class DetectionScheduler:
+    """Decides which frames run face detection and maps downscaled detections back to full size"""
+
+    def __init__(self, detector, interval=1, target_fps=None, scale=1.0, max_interval=10,
+                 scale_factor=1.3, min_neighbors=5, smoothing=0.1):
+        self.detector = detector
+        self.interval = max(1, int(interval))  # Detect on every Nth frame
+        self.target_fps = target_fps  # When set, the interval adapts to hold this frame rate
+        self.scale = scale  # Detection runs on the frame resized by this factor
+        self.max_interval = max_interval
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.smoothing = smoothing
+
+        self.frame_count = 0
+        self.detect_time = None  # Moving average of seconds spent in detectMultiScale
+        self.frame_time = None  # Moving average of seconds per frame excluding detection
+
+    def should_detect(self):
+        """Call once per frame; True when this frame should run detection"""
+        detect = self.frame_count % self.interval == 0
+        self.frame_count += 1
+        return detect
+
+    def detect(self, gray):
+        """Detect faces on a grayscale frame, returning boxes in full-resolution coordinates"""
+        started = time.perf_counter()
+
+        if self.scale != 1.0:
+            small = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            faces = self.detector.detectMultiScale(small, self.scale_factor, self.min_neighbors)
+            faces = [tuple(int(round(v / self.scale)) for v in box) for box in faces]
+        else:
+            faces = [tuple(int(v) for v in box) for box in self.detector.detectMultiScale(gray, self.scale_factor, self.min_neighbors)]
+
+        self.detect_time = self._average(self.detect_time, time.perf_counter() - started)
+        return faces
+
+    def _average(self, current, sample):
+        if current is None:
+            return sample
+        return current + self.smoothing * (sample - current)
+
+    def frame_done(self, elapsed, detected=False):
+        """Report how long a frame took to process so the adaptive interval can follow the load"""
+        if detected and self.detect_time is not None:
+            elapsed = max(0.0, elapsed - self.detect_time)
+        self.frame_time = self._average(self.frame_time, elapsed)
+
+        if not self.target_fps or self.detect_time is None:
+            return
+
+        # Spread the detection cost over enough frames that the average frame fits the budget:
+        # detect_time / interval + frame_time <= 1 / target_fps
+        spare = 1.0 / self.target_fps - self.frame_time
+        if spare <= 0:
+            self.interval = self.max_interval
+        else:
+            self.interval = min(self.max_interval, max(1, math.ceil(self.detect_time / spare)))
@@ -0,0 +1,175 @@
+"""
+Resident face embedding model
+Loads the recognition model and detector backend once per process and warms them up before use
+"""
+
+import threading
+import numpy as np
+import cv2
+from deepface import DeepFace
+
+
+def preprocess_face(face_img, target_size):
+    """Letterbox a BGR face crop into the model input size and scale it to [0, 1], as DeepFace does"""
+    target_w, target_h = target_size
+    h, w = face_img.shape[:2]
+    factor = min(target_h / h, target_w / w)
+    resized = cv2.resize(face_img, (max(1, int(w * factor)), max(1, int(h * factor))))
+
+    # Pad the remaining border with black, keeping the face centred
+    diff_h = target_h - resized.shape[0]
+    diff_w = target_w - resized.shape[1]
+    padded = np.pad(
+        resized,
+        ((diff_h // 2, diff_h - diff_h // 2), (diff_w // 2, diff_w - diff_w // 2), (0, 0)),
+        mode='constant'
+    )
+    if padded.shape[:2] != (target_h, target_w):
+        padded = cv2.resize(padded, (target_w, target_h))
+    return padded.astype(np.float32) / 255
+
+
+EYE_CASCADE = cv2.data.haarcascades + 'haarcascade_eye.xml'
+eye_detector_local = threading.local()  # One eye cascade per thread; a cascade must not be shared between threads
+
+
+def eye_detector():
+    """Eye cascade of the calling thread, loaded on its first use"""
+    detector = getattr(eye_detector_local, 'cascade', None)
+    if detector is None:
+        detector = eye_detector_local.cascade = cv2.CascadeClassifier(EYE_CASCADE)
+    return detector
+
+
+def align_face(face_img, max_angle=45):
+    """Rotate a face crop so the eyes are level, finding only the eyes inside the crop"""
+    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape
+
+    # Eyes are in the upper half of a Haar face box
+    eyes = eye_detector().detectMultiScale(gray[:h // 2], 1.1, 10)
+    if len(eyes) < 2:
+        return face_img
+
+    # Use the two largest candidates, ordered left to right
+    eyes = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+    (x1, y1, w1, h1), (x2, y2, w2, h2) = sorted(eyes, key=lambda e: e[0])
+    left_eye = (x1 + w1 / 2, y1 + h1 / 2)
+    right_eye = (x2 + w2 / 2, y2 + h2 / 2)
+
+    angle = np.degrees(np.arctan2(right_eye[1] - left_eye[1], right_eye[0] - left_eye[0]))
+    if abs(angle) > max_angle:
+        return face_img
+
+    center = ((left_eye[0] + right_eye[0]) / 2, (left_eye[1] + right_eye[1]) / 2)
+    rotation = cv2.getRotationMatrix2D(center, angle, 1.0)
+    return cv2.warpAffine(face_img, rotation, (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+
+class FaceEmbedder:
+    """Single shared instance of the configured DeepFace model"""
+
+    def __init__(self, model_name="VGG-Face", detector_backend="opencv", align=True, align_crops=True):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.align = align
+        self.align_crops = align_crops  # Level the eyes of face crops before embedding them
+        self.model = None
+        self.ready = threading.Event()
+        self.error = None
+        self.lock = threading.Lock()
+
+    def warm_up(self):
+        """Build the model and run one dummy inference so the first real face is not slow"""
+        with self.lock:
+            if self.ready.is_set():
+                return self
+            try:
+                # DeepFace caches built models by name, so every later call reuses this instance
+                self.model = DeepFace.build_model(self.model_name)
+
+                # A blank image goes through the detector backend and the model once
+                DeepFace.represent(
+                    np.zeros((224, 224, 3), dtype=np.uint8),
+                    model_name=self.model_name,
+                    detector_backend=self.detector_backend,
+                    enforce_detection=False,
+                    align=self.align
+                )
+                self.error = None
+                self.ready.set()
+            except Exception as e:
+                self.error = str(e)
+                raise
+        return self
+
+    def start(self, on_ready=None):
+        """Warm up on a background thread, then call on_ready()"""
+        def run():
+            try:
+                self.warm_up()
+            except Exception as e:
+                print(f"Error loading {self.model_name}: {e}")
+                return
+            if on_ready is not None:
+                on_ready()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self):
+        return self.ready.is_set()
+
+    def status(self):
+        return {
+            'ready': self.is_ready(),
+            'model': self.model_name,
+            'detector': self.detector_backend,
+            'error': self.error
+        }
+
+    def represent(self, img):
+        """Detect, align and embed the face in a whole image (file path or BGR array)"""
+        if not self.ready.is_set():
+            self.warm_up()
+
+        result = DeepFace.represent(
+            img,
+            model_name=self.model_name,
+            detector_backend=self.detector_backend,
+            enforce_detection=False,
+            align=self.align
+        )
+        return np.asarray(result[0]['embedding'], dtype=np.float32)
+
+    def represent_crop(self, face_img):
+        """Embed one face that was already boxed by the caller"""
+        return self.represent_batch([face_img])[0]
+
+    def represent_batch(self, face_imgs):
+        """Embed already-cropped BGR faces with a single batched forward pass
+
+        The crops go straight to the model: no detector backend runs on them, only the
+        optional eye-landmark alignment.
+        """
+        if len(face_imgs) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        if not self.ready.is_set():
+            self.warm_up()
+
+        if self.align_crops:
+            face_imgs = [align_face(face_img) for face_img in face_imgs]
+
+        batch = np.stack([preprocess_face(face_img, self.model.input_shape) for face_img in face_imgs])
+        embeddings = np.asarray(self.model.forward(batch), dtype=np.float32)
+
+        if embeddings.ndim == 2 and len(embeddings) == len(batch):
+            return embeddings
+        if len(batch) == 1:
+            return embeddings.reshape(1, -1)
+
+        # Older DeepFace releases only return the first embedding of a batch from forward()
+        rows = [embeddings.reshape(-1)]
+        rows += [np.asarray(self.model.forward(img[np.newaxis]), dtype=np.float32).reshape(-1) for img in batch[1:]]
+        return np.vstack(rows)
@@ -0,0 +1,120 @@
+"""
+Content-addressed embedding cache
+Remembers the embedding of every image by its file hash, so rebuilding a gallery only embeds new or changed images
+"""
+
+import os
+import hashlib
+import threading
+import numpy as np
+from embedding_store import store_key
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """Embeddings stored as <root>/<model>_<detector>/<hash[:2]>/<hash>.npy
+
+    Each model / detector pair has its own directory, so switching models only misses for the
+    new key. Reads refresh an entry's mtime; once the cache grows past max_bytes the least
+    recently used entries are deleted.
+    """
+
+    def __init__(self, root, model_name="VGG-Face", detector_backend="opencv", max_bytes=512 * 1024 * 1024):
+        self.root = root
+        self.directory = os.path.join(root, store_key(model_name, detector_backend))
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.size = None  # Total bytes on disk, counted on first write
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], f"{digest}.npy")
+
+    def get(self, digest):
+        """Cached embedding for a content hash, or None"""
+        path = self._path(digest)
+        try:
+            embedding = np.load(path)
+            os.utime(path)  # Mark as recently used
+        except (FileNotFoundError, ValueError, OSError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return embedding
+
+    def put(self, digest, embedding):
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write next to the entry and rename, so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(embedding, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            if self.size is None:
+                self.size = self._disk_size()
+            else:
+                self.size += os.path.getsize(path)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        if os.path.isdir(self.root):
+            for directory, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    if filename.endswith('.npy'):
+                        path = os.path.join(directory, filename)
+                        try:
+                            stat = os.stat(path)
+                        except FileNotFoundError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _disk_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # Called with the lock held; shrink to 90% of the limit so eviction does not run on every write
+        entries = sorted(self._entries())
+        self.size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except FileNotFoundError:
+                pass
+
+    def embed(self, path, represent, digest=None):
+        """Embedding of an image file, computing it with represent(path) only on a cache miss
+
+        digest is the file's content hash, if the caller has already computed it.
+        """
+        digest = digest or file_hash(path)
+        embedding = self.get(digest)
+        if embedding is None:
+            embedding = np.asarray(represent(path), dtype=np.float32)
+            self.put(digest, embedding)
+        return embedding
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'bytes': self.size}
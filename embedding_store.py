@@ -0,0 +1,308 @@
+"""
+On-disk embedding store
+A raw float matrix file plus an append-only identity index, memory-mapped at startup
+"""
+
+import os
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not on Windows: writers are then only serialized within one process
+
+
+def store_key(model_name, detector_backend):
+    """File name prefix for one model / detector combination, e.g. vggface_opencv"""
+    model = ''.join(c for c in model_name.lower() if c.isalnum())
+    detector = ''.join(c for c in detector_backend.lower() if c.isalnum())
+    return f"{model}_{detector}"
+
+
+class StoreRewritten(RuntimeError):
+    """The store files were replaced, e.g. by index_faces.py, since this process opened them"""
+
+
+class EmbeddingStore:
+    """Embeddings of one model / detector pair, stored as <key>.<generation>.emb + <key>.<generation>.index.jsonl
+
+    <key>.meta.json names the files of the current generation and is the only file a rewrite
+    swaps in place, so a crash mid-rewrite leaves either the old or the new store, never a mix.
+
+    Unit-length and raw (euclidean) rows are kept in separate files, so changing the distance
+    metric never reads rows stored for the other one. Each index entry also records the
+    content hash of its image, so changed files can be told apart from known ones. Rows are
+    only ever appended.
+
+    Every rewrite() starts a new generation in new files. Writers hold <key>.lock across processes, and
+    append() refuses to extend a generation other than the one this process opened.
+
+    Deleting an image appends a tombstone to the index, and compact() rewrites the files
+    without the deleted rows.
+    """
+
+    def __init__(self, root, model_name="VGG-Face", detector_backend="opencv", dtype="float32", normalize=False):
+        self.root = root
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.dtype = np.dtype(dtype)  # float16 halves the file size; rows are upcast for matching
+        self.normalize = normalize  # Store unit-length rows so cosine matching needs no normalized copy
+        self.lock = threading.Lock()
+        self.hashes = {}  # Image path -> content hash of its live row, as of the last open()
+        self.generation = None  # Generation of the files this process has open
+        self.rows = None  # Rows indexed in that generation, tombstoned ones included; None until known
+
+        self.key = store_key(model_name, detector_backend)
+        if not normalize:
+            self.key += "_raw"
+        self.meta_path = os.path.join(root, f"{self.key}.meta.json")
+        self.lock_path = os.path.join(root, f"{self.key}.lock")
+        # Files of the current generation, as named by the meta file
+        self.matrix_path = os.path.join(root, f"{self.key}.emb")
+        self.index_path = os.path.join(root, f"{self.key}.index.jsonl")
+
+    @contextmanager
+    def _file_lock(self):
+        # Serializes writers of different processes, e.g. index_faces.py next to a running app
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def exists(self):
+        if not os.path.exists(self.meta_path):
+            return False
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        except ValueError:
+            return False
+        return os.path.exists(self._files(meta)[1])
+
+    def _files(self, meta):
+        # (matrix, index) paths named by a meta file; stores written before generations had fixed names
+        return (os.path.join(self.root, meta.get('matrix', f"{self.key}.emb")),
+                os.path.join(self.root, meta.get('index', f"{self.key}.index.jsonl")))
+
+    def _read_meta(self):
+        """Validated meta file; matrix_path and index_path are switched to the files it names"""
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        if meta['model'] != self.model_name or meta['detector'] != self.detector_backend:
+            raise ValueError(f"{self.meta_path} belongs to {meta['model']} / {meta['detector']}")
+        if meta.get('normalized', False) != self.normalize:
+            raise ValueError(f"{self.meta_path} holds {'unit-length' if meta.get('normalized') else 'raw'} rows")
+        self.matrix_path, self.index_path = self._files(meta)
+        return meta
+
+    def _new_generation(self):
+        self.generation = uuid.uuid4().hex
+        self.matrix_path = os.path.join(self.root, f"{self.key}.{self.generation}.emb")
+        self.index_path = os.path.join(self.root, f"{self.key}.{self.generation}.index.jsonl")
+        self.rows = 0
+
+    def _meta(self, dim):
+        return {
+            'model': self.model_name,
+            'detector': self.detector_backend,
+            'dtype': self.dtype.name,
+            'dim': int(dim),
+            'normalized': self.normalize,
+            'generation': self.generation,
+            'matrix': os.path.basename(self.matrix_path),
+            'index': os.path.basename(self.index_path)
+        }
+
+    def _prepare(self, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        if self.normalize:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            embeddings = embeddings / norms
+        return embeddings.astype(self.dtype)
+
+    def open(self):
+        """Memory-map the matrix and read the index
+
+        Returns (embeddings, identities): identities[i] is the image path of row i,
+        or None if that row was deleted. The content hash of each live row is left in hashes.
+        """
+        with self.lock, self._file_lock():
+            meta = self._read_meta()
+            dtype = np.dtype(meta['dtype'])
+            dim = meta['dim']
+            self.generation = meta.get('generation')
+
+            # Rows appended later must match the rows already on disk
+            self.dtype = dtype
+
+            identities = []
+            hashes = []
+            rows = {}
+            with open(self.index_path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if 'delete' in entry:
+                        # A path can have several rows, e.g. re-enrolled under the same file name
+                        for row in rows.pop(entry['delete'], []):
+                            identities[row] = None
+                    else:
+                        rows.setdefault(entry['path'], []).append(len(identities))
+                        identities.append(entry['path'])
+                        hashes.append(entry.get('hash'))
+
+            # A crash between writing rows and the index can leave extra rows; ignore them
+            file_rows = 0
+            if dim and os.path.exists(self.matrix_path):
+                file_rows = os.path.getsize(self.matrix_path) // (dtype.itemsize * dim)
+            self.rows = len(identities)
+            count = min(file_rows, len(identities))
+            identities = identities[:count]
+            self.hashes = {path: digest for path, digest in zip(identities, hashes) if path is not None}
+
+            if count == 0:
+                return np.zeros((0, dim), dtype=dtype), identities
+            embeddings = np.memmap(self.matrix_path, dtype=dtype, mode='r', shape=(count, dim))
+            return embeddings, identities
+
+    def matrix(self, rows):
+        """Memory-map the first rows of the matrix, e.g. after appending to an opened store"""
+        with self.lock, self._file_lock():
+            meta = self._read_meta()
+            if self.generation is not None and meta.get('generation') != self.generation:
+                raise StoreRewritten(f"{self.meta_path} was rewritten by another process")
+            dim = meta['dim']
+            if rows == 0:
+                return np.zeros((0, dim), dtype=self.dtype)
+            return np.memmap(self.matrix_path, dtype=self.dtype, mode='r', shape=(rows, dim))
+
+    def append(self, paths, embeddings, hashes=None):
+        """Append rows for the given image paths, with the content hash of each image if known
+
+        Raises StoreRewritten if the files were replaced since open(); open() again and retry.
+        """
+        os.makedirs(self.root, exist_ok=True)
+
+        with self.lock, self._file_lock():
+            meta = self._read_meta() if os.path.exists(self.meta_path) else None
+            if meta is not None:
+                if self.generation is not None and meta.get('generation') != self.generation:
+                    raise StoreRewritten(f"{self.meta_path} was rewritten by another process")
+                self.generation = meta.get('generation')
+                self.dtype = np.dtype(meta['dtype'])
+            embeddings = self._prepare(embeddings)
+
+            if meta is None:
+                self._new_generation()
+            if meta is None or meta['dim'] == 0:
+                self._write_json(self.meta_path, self._meta(embeddings.shape[1]))
+            elif meta['dim'] != embeddings.shape[1]:
+                raise ValueError(f"Embedding size {embeddings.shape[1]} does not match {self.meta_path}")
+
+            # A crash between writing rows and the index can leave extra rows; drop them so
+            # the new rows land right after the indexed ones
+            if self.rows is None:
+                self.rows = self._indexed_rows()
+            indexed_size = self.rows * embeddings.shape[1] * self.dtype.itemsize
+            if os.path.exists(self.matrix_path) and os.path.getsize(self.matrix_path) > indexed_size:
+                os.truncate(self.matrix_path, indexed_size)
+
+            with open(self.matrix_path, 'ab') as f:
+                f.write(embeddings.tobytes())
+            with open(self.index_path, 'a') as f:
+                self._write_entries(f, paths, hashes)
+            self.rows += len(paths)
+
+    def _indexed_rows(self):
+        # Every entry but a tombstone has a row in the matrix; only read when this process
+        # appends to a store it has not opened
+        rows = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    if line.strip() and 'delete' not in json.loads(line):
+                        rows += 1
+        return rows
+
+    def delete(self, path):
+        """Tombstone every row of an image path"""
+        with self.lock, self._file_lock():
+            if not os.path.exists(self.meta_path):
+                return
+            self._read_meta()
+            with open(self.index_path, 'a') as f:
+                f.write(json.dumps({'delete': path}) + '\n')
+
+    def rewrite(self, paths, embeddings, hashes=None):
+        """Atomically replace the whole store with the given rows, as a new generation"""
+        embeddings = self._prepare(embeddings) if len(paths) else None
+        os.makedirs(self.root, exist_ok=True)
+
+        with self.lock, self._file_lock():
+            dim = embeddings.shape[1] if embeddings is not None else self._existing_dim()
+            self._new_generation()
+
+            # The new generation's files are invisible until the meta file names them
+            with open(self.matrix_path, 'wb') as f:
+                if embeddings is not None:
+                    f.write(embeddings.tobytes())
+            with open(self.index_path, 'w') as f:
+                self._write_entries(f, paths, hashes)
+            self._write_json(self.meta_path, self._meta(dim))
+            self.rows = len(paths)
+
+            self._remove_stale_files()
+
+    def _remove_stale_files(self):
+        # Files of earlier generations, or of a rewrite that crashed before its meta swap
+        current = {os.path.basename(self.matrix_path), os.path.basename(self.index_path)}
+        for filename in os.listdir(self.root):
+            if (filename.startswith(self.key + '.') and filename.endswith(('.emb', '.index.jsonl'))
+                    and filename not in current):
+                try:
+                    os.remove(os.path.join(self.root, filename))
+                except OSError:
+                    pass  # e.g. still memory-mapped by another process on Windows
+
+    def compact(self):
+        """Rewrite the store without deleted rows"""
+        embeddings, identities = self.open()
+        keep = [i for i, path in enumerate(identities) if path is not None]
+        paths = [identities[i] for i in keep]
+        self.rewrite(paths, np.asarray(embeddings[keep], dtype=np.float32), [self.hashes.get(path) for path in paths])
+        return len(identities) - len(keep)
+
+    def _existing_dim(self):
+        try:
+            return self._read_meta()['dim']
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    @staticmethod
+    def _write_entries(f, paths, hashes=None):
+        for path, digest in zip(paths, hashes or [None] * len(paths)):
+            entry = {'path': path}
+            if digest is not None:
+                entry['hash'] = digest
+            f.write(json.dumps(entry) + '\n')
+
+    @staticmethod
+    def _write_json(path, data):
+        # Written next to the real file and renamed, so readers never see a partial file
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
@@ -10,165 +10,213 @@ import time
 import numpy as np
 from flask import Flask, render_template, Response, jsonify, request
 import threading
+from camera_stream import CameraStream
+from broadcaster import FrameBroadcaster
+from tracker import FaceTracker
+from detection import DetectionScheduler
+from template_gallery import TemplateGallery
+from unknown_faces import UnknownFaceRecorder
+from metrics import Metrics
+from jpeg_encoder import JpegEncoder
 
 # Create face database directory if it doesn't exist
 face_database_dir = 'face_database'
 if not os.path.exists(face_database_dir):
     os.makedirs(face_database_dir)
 
+# Unknown faces are kept next to the database, not in it: app.py enrolls every subfolder of
+# face_database as a person, so an "unknown" folder there would be matched as an identity
+unknown_faces_dir = 'unknown_captures'
+unknown_capture_cooldown = 30.0  # Seconds before the same tracked face may be saved again
+
 app = Flask(__name__)
 
 # Global variables
 camera = None
+camera_source = 0  # Device index, video file, image directory or stream URL
 camera_active = False
 recognize_faces = True  # Set to True by default to immediately recognize faces
 lock = threading.Lock()
 face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+recognition_refresh_interval = 5.0  # Seconds before a tracked face is matched again
+detection_interval = 1  # Run face detection on every Nth frame
+detection_target_fps = None  # When set, the detection interval adapts to hold this frame rate
+detection_scale = 1.0  # Detect on a frame downscaled by this factor (e.g. 0.5)
+metrics_enabled = True  # Collect pipeline timings and counters for /metrics
+stream_jpeg_quality = 80  # JPEG quality of /video_feed frames (1-100)
+stream_scale = 1.0  # Resize /video_feed frames by this factor before encoding (e.g. 0.5)
+stream_max_fps = None  # When set, the feed produces at most this many frames per second
+jpeg_backend = "auto"  # Can be "auto" (turbojpeg when installed), "opencv" or "turbojpeg"
+
+# Per-stage latencies and frame counters of the video pipeline
+metrics = Metrics(enabled=metrics_enabled, namespace="face_recognition")
+stage_seconds = metrics.histogram("stage_seconds", "Time spent in each stage of the frame pipeline", label="stage")
+frame_rate = metrics.frame_rate("frames_per_second", "Processed frames per second")
+frames_total = metrics.counter("frames_total", "Frames processed")
+faces_per_frame = metrics.histogram("faces_per_frame", "Faces tracked in each frame", buckets=(0, 1, 2, 3, 5, 8, 13))
+dropped_frames = metrics.counter("camera_frames_dropped_total", "Captured frames overwritten before processing")
+recognition_cache = metrics.counter("recognition_cache_total", "Tracked faces that reused a result (hit) or were matched again (miss)", label="result")
+recognitions = metrics.counter("recognitions_total", "Template matches by outcome", label="result")
+unknown_saved = metrics.counter("unknown_faces_saved_total", "Unknown faces written to disk")
+
+# Picks the frames that run detection, on a downscaled copy if configured
+detection_scheduler = DetectionScheduler(face_cascade, detection_interval, detection_target_fps, detection_scale)
+
+# Keeps names attached to face boxes across frames so each face is matched once per track
+face_tracker = FaceTracker(refresh_interval=recognition_refresh_interval, min_confidence=0.6)
+
+# 100x100 grayscale templates of every database face, held in memory
+face_templates = TemplateGallery(face_database_dir, exclude_prefix='unknown')
+
+# Saves each unknown face once per track and cooldown, skipping near-duplicates
+unknown_recorder = UnknownFaceRecorder(unknown_faces_dir, cooldown=unknown_capture_cooldown)
 
 def find_matching_face(face_img, threshold=0.6):
     """Find matching face in the database using template matching"""
-    best_match = None
-    best_match_score = 0
-    
-    # Resize face image for comparison
-    face_img_small = cv2.resize(face_img, (100, 100))
-    
-    # Loop through all faces in the database
-    if os.path.exists(face_database_dir):
-        for filename in os.listdir(face_database_dir):
-            if not filename.endswith(('.jpg', '.jpeg', '.png')):
-                continue
-                
-            try:
-                # Load the database face
-                db_face_path = os.path.join(face_database_dir, filename)
-                db_face = cv2.imread(db_face_path)
-                if db_face is None:
-                    continue
-                
-                # Resize database face to the same size
-                db_face_small = cv2.resize(db_face, (100, 100))
-                
-                # Convert both faces to grayscale
-                face_gray = cv2.cvtColor(face_img_small, cv2.COLOR_BGR2GRAY)
-                db_face_gray = cv2.cvtColor(db_face_small, cv2.COLOR_BGR2GRAY)
-                
-                # Compare using template matching
-                result = cv2.matchTemplate(db_face_gray, face_gray, cv2.TM_CCOEFF_NORMED)
-                _, max_val, _, _ = cv2.minMaxLoc(result)
-                
-                # If this match is better than our previous best, update
-                if max_val > best_match_score and max_val > threshold:
-                    best_match_score = max_val
-                    best_match = os.path.splitext(filename)[0]  # Get name without extension
-            except Exception as e:
-                print(f"Error processing {filename}: {str(e)}")
-                continue
-                
-    return best_match, best_match_score
+    # Templates are preloaded and scored all at once; they reload only when the directory changes
+    return face_templates.match(face_img, threshold)
 
 def generate_frames():
-    """Generate frames from the camera with face detection and recognition"""
+    """Generate JPEG frames from the camera with face detection and recognition"""
     global camera, camera_active, recognize_faces
+    frame_id = 0
     
     while True:
+        # Only hold the lock long enough to grab the current camera
         with lock:
-            if not camera_active or camera is None:
-                # Return an empty frame if camera is not active
-                empty_frame = np.zeros((480, 640, 3), np.uint8)
-                cv2.putText(empty_frame, "Camera Off", (220, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                _, buffer = cv2.imencode('.jpg', empty_frame)
-                frame = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                time.sleep(0.1)  # Prevent excessive CPU usage
-                continue
+            stream = camera if camera_active else None
+        
+        if stream is None:
+            # Return an empty frame if camera is not active
+            empty_frame = np.zeros((480, 640, 3), np.uint8)
+            cv2.putText(empty_frame, "Camera Off", (220, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+            yield empty_frame
+            time.sleep(0.1)  # Prevent excessive CPU usage
+            continue
+        
+        # Take the newest captured frame; stale frames are dropped by the capture thread
+        clock = metrics.clock()
+        last_frame_id = frame_id
+        frame_id, success, frame = stream.wait(frame_id)
+        clock = stage_seconds.since(clock, "capture")
+        if last_frame_id and frame_id > last_frame_id + 1:
+            dropped_frames.inc(frame_id - last_frame_id - 1)
+        if not success:
+            empty_frame = np.zeros((480, 640, 3), np.uint8)
+            cv2.putText(empty_frame, "Camera Error", (220, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+            yield empty_frame
+            continue
             
-            success, frame = camera.read()
-            if not success:
-                empty_frame = np.zeros((480, 640, 3), np.uint8)
-                cv2.putText(empty_frame, "Camera Error", (220, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                _, buffer = cv2.imencode('.jpg', empty_frame)
-                frame = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                continue
-                
-            # Mirror the frame horizontally (selfie mode)
-            frame = cv2.flip(frame, 1)
-            
-            # Detect faces
+        # Mirror the frame horizontally (selfie mode)
+        frame = cv2.flip(frame, 1)
+        
+        # Detect faces only on the frames the scheduler picks; in between, reuse the tracked boxes
+        started = time.perf_counter()
+        detected = detection_scheduler.should_detect()
+        if detected:
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+            clock = stage_seconds.since(clock, "gray")
+            faces = detection_scheduler.detect(gray)
             
-            # Process each detected face
-            for (x, y, w, h) in faces:
-                # Draw rectangle around the face - make it thicker (3 pixels)
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 3)
-                
+            # Follow faces between frames so each one is only matched once per track
+            tracks = face_tracker.update(faces, frame)
+        else:
+            tracks = face_tracker.predict(frame)
+        clock = stage_seconds.since(clock, "detect" if detected else "track")
+        
+        # Process each tracked face
+        for track in tracks:
+            x, y, w, h = track.box
+            
+            # Match new tracks, or old ones once their result is due for a refresh
+            if face_tracker.needs_recognition(track):
                 # Extract the face region
-                face_img = frame[y:y+h, x:x+w]
+                face_img = frame[y:y+h, x:x+w].copy()
                 
                 # Find matching face
+                match_started = metrics.clock()
                 match_name, confidence = find_matching_face(face_img)
-
-                print(f"Match: {match_name}, Confidence: {confidence:.2f}")
+                stage_seconds.since(match_started, "recognition")
+                face_tracker.mark_submitted(track)
+                face_tracker.set_result(track.track_id, match_name, confidence)
+                recognition_cache.inc(label_value="miss")
+                recognitions.inc(label_value="known" if match_name else "unknown")
                 
-                if match_name:
-                    # Display the name in RED and BOLD (larger font size and thickness)
-                    label = f"{match_name} ({confidence:.2f})"
-                    
-                    # Add a dark background for better visibility of the red text
-                    text_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_DUPLEX, 1.2, 3)[0]
-                    cv2.rectangle(frame, 
-                                 (x, y - text_size[1] - 10), 
-                                 (x + text_size[0] + 10, y), 
-                                 (0, 0, 0), -1)
-                    
-                    # Draw the name text in red, bold
-                    cv2.putText(frame, label, 
-                               (x + 5, y - 5), 
-                               cv2.FONT_HERSHEY_DUPLEX, 
-                               1.2,  # Larger font 
-                               (0, 0, 255),  # RED color
-                               3)  # Thicker text
-                else:
-                    captured_once = False
-
-                    # Display "Unknown" in red
-                    # Add a dark background for better visibility
-                    text_size = cv2.getTextSize("Unknown", cv2.FONT_HERSHEY_DUPLEX, 1.2, 3)[0]
-                    cv2.rectangle(frame, 
-                                 (x, y - text_size[1] - 10), 
-                                 (x + text_size[0] + 10, y), 
-                                 (0, 0, 0), -1)
-                    
-                    # Draw "Unknown" text in red, bold
-                    cv2.putText(frame, "Unknown", 
-                               (x + 5, y - 5), 
-                               cv2.FONT_HERSHEY_DUPLEX, 
-                               1.2,  # Larger font
-                               (0, 0, 255),  # RED color
-                               3)  # Thicker text
-                    
-                    if not captured_once:
-                        captured_face = cv2.resize(face_img, (100, 100))
-                        # Save the unknown face to the database
-                        unknown_face_path = os.path.join(face_database_dir, f"unknown{int(time.time())}.jpg")
-                        cv2.imwrite(unknown_face_path, captured_face)
-                        print(f"Unknown face saved to {unknown_face_path}")
-                        captured_once = True
-                                
-            # Add recognition status overlay
-            status_text = "Recognition: ON"
-            cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+                if not match_name:
+                    # Save the unknown face in the background, once per track and cooldown
+                    if unknown_recorder.consider(track.track_id, face_img):
+                        unknown_saved.inc()
+            else:
+                recognition_cache.inc(label_value="hit")
+            
+            # Draw rectangle around the face - make it thicker (3 pixels)
+            cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 3)
             
-            # Convert to jpg and yield
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                  b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            match_name, confidence = track.result, track.confidence
+            if match_name:
+                # Display the name in RED and BOLD (larger font size and thickness)
+                label = f"{match_name} ({confidence:.2f})"
+                
+                # Add a dark background for better visibility of the red text
+                text_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_DUPLEX, 1.2, 3)[0]
+                cv2.rectangle(frame, 
+                             (x, y - text_size[1] - 10), 
+                             (x + text_size[0] + 10, y), 
+                             (0, 0, 0), -1)
+                
+                # Draw the name text in red, bold
+                cv2.putText(frame, label, 
+                           (x + 5, y - 5), 
+                           cv2.FONT_HERSHEY_DUPLEX, 
+                           1.2,  # Larger font 
+                           (0, 0, 255),  # RED color
+                           3)  # Thicker text
+            else:
+                # Display "Unknown" in red
+                # Add a dark background for better visibility
+                text_size = cv2.getTextSize("Unknown", cv2.FONT_HERSHEY_DUPLEX, 1.2, 3)[0]
+                cv2.rectangle(frame, 
+                             (x, y - text_size[1] - 10), 
+                             (x + text_size[0] + 10, y), 
+                             (0, 0, 0), -1)
+                
+                # Draw "Unknown" text in red, bold
+                cv2.putText(frame, "Unknown", 
+                           (x + 5, y - 5), 
+                           cv2.FONT_HERSHEY_DUPLEX, 
+                           1.2,  # Larger font
+                           (0, 0, 255),  # RED color
+                           3)  # Thicker text
+                            
+        # Add recognition status overlay
+        status_text = "Recognition: ON"
+        cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        
+        stage_seconds.since(clock, "draw")
+        
+        detection_scheduler.frame_done(time.perf_counter() - started, detected)
+        
+        frames_total.inc()
+        faces_per_frame.observe(len(tracks))
+        frame_rate.tick()
+        
+        # Yield the frame; the broadcaster's encoder thread converts it to jpg
+        yield frame
+
+
+# JPEG encoding of the output feed, run once per produced frame
+jpeg_encoder = JpegEncoder(stream_jpeg_quality, stream_scale, jpeg_backend)
+
+def encode_frame(frame):
+    clock = metrics.clock()
+    jpeg = jpeg_encoder.encode(frame)
+    stage_seconds.since(clock, "imencode")
+    return jpeg
 
+# Single processing pipeline shared by every /video_feed client
+broadcaster = FrameBroadcaster(generate_frames, encode_frame, stream_max_fps)
+metrics.counter("stream_frames_skipped_total", "Frames a slow viewer skipped to stay on the newest one",
+                function=lambda: broadcaster.skipped_frames)
 
 # Routes
 @app.route('/')
@@ -209,13 +257,20 @@ def index():
 def video_feed():
     """Video streaming route"""
 
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(broadcaster.stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target"""
+    if not metrics.enabled:
+        return "Metrics are disabled\n", 404, {'Content-Type': 'text/plain'}
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/label_unknown_faces', methods=['POST', 'GET'])
 def label_unknown_faces():
     if request.method == 'GET':
         # Return the list of unknown faces
-        unknown_faces = ["http://localhost:8000/static/" + str(f) for f in os.listdir(face_database_dir) if f.startswith('unknown')]
+        unknown_faces = ["http://localhost:8000/static/" + str(f) for f in unknown_recorder.list_faces()]
         return jsonify({"unknown_faces": unknown_faces})
     
     return jsonify({"success": False, "message": "Invalid request method"})
@@ -226,6 +281,8 @@ def static_file(filename):
     """Serve static files"""
     try:
         file_path = os.path.join("face_database", filename)
+        if not os.path.exists(file_path):
+            file_path = os.path.join(unknown_faces_dir, filename)
         if not os.path.exists(file_path):
             return jsonify({"error": "File not found"}), 404
 
@@ -235,6 +292,24 @@ def static_file(filename):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/start_camera', methods=['POST'])
+def start_camera():
+    """Start the camera"""
+    global camera, camera_active
+    try:
+        with lock:
+            if camera is None:
+                stream = CameraStream(camera_source, 640, 480)
+                if not stream.isOpened():
+                    stream.release()
+                    return jsonify({"success": False, "message": "Failed to open camera"})
+                # Capture on a background thread that keeps only the newest frame
+                camera = stream.start()
+            camera_active = True
+        return jsonify({"success": True})
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)})
+
 @app.route('/stop_camera', methods=['POST'])
 def stop_camera():
     """Stop the camera"""
@@ -0,0 +1,314 @@
+"""
+In-memory face embedding gallery
+Keeps every enrolled embedding in one matrix so recognition only embeds the probe face
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from ann_index import build_index, ExactIndex, IVFIndex
+from embedding_cache import file_hash
+from embedding_store import StoreRewritten
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+
+def identity_name(path):
+    """Person name for an image stored as <db_path>/<name>/<file>"""
+    return os.path.basename(os.path.dirname(path))
+
+
+def scan_images(db_path):
+    """Paths of every image stored as db_path/<name>/<file>"""
+    paths = []
+    if os.path.exists(db_path):
+        for person_name in sorted(os.listdir(db_path)):
+            person_dir = os.path.join(db_path, person_name)
+            if not os.path.isdir(person_dir):
+                continue
+
+            for filename in sorted(os.listdir(person_dir)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(person_dir, filename))
+    return paths
+
+
+def embed_image(path, represent, cache=None, digest=None):
+    """Enrollment embedding of an image file: represent(path), through the content-hash cache when given
+
+    The app and index_faces.py both enroll through here, so every stored row comes from the
+    same pipeline.
+    """
+    if cache is None:
+        return represent(path)
+    return cache.embed(path, represent, digest)
+
+
+class EmbeddingGallery:
+    """Matrix of enrolled face embeddings with the source image path of each row"""
+
+    def __init__(self, embedder, distance_metric="cosine", store=None,
+                 index_type="exact", ann_min_size=10000, index_options=None, cache=None, compact_ratio=0.25):
+        # embedder is the shared FaceEmbedder used for both enrollment and probes
+        self.embedder = embedder
+        self.distance_metric = distance_metric
+        # Optional EmbeddingStore the gallery is memory-mapped from and persisted to
+        self.store = store
+        # Optional EmbeddingCache, so images embedded before (by content) are not embedded again
+        self.cache = cache
+        # The store is compacted on load once this fraction of its rows are tombstoned
+        self.compact_ratio = compact_ratio
+        # "exact" scans every row; "ivf" is approximate, used once the gallery has ann_min_size rows;
+        # "prototype" matches against a few embeddings per person and verifies borderline scores
+        self.index_type = index_type
+        self.ann_min_size = ann_min_size
+        self.index_options = index_options or {}
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()  # One index build at a time, never under self.lock
+        # Held for a whole load(); enrollment waits for it, so a load cannot replace a row added meanwhile
+        self.load_lock = threading.Lock()
+        # Rebuilds due after an enrollment run here, so the enrolling request does not wait for them
+        self.builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gallery-index')
+        self.loaded = threading.Event()
+
+        # One row per enrolled image; identities[i] is the image path of embeddings[i],
+        # or None once that image has been deleted
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.identities = []
+        self.count = 0
+        self._index = None
+        self._index_stale = False  # The index still answers searches but is due to be rebuilt
+        self._version = 0  # Bumped on every change, so an index built from an older snapshot is discarded
+
+    def __len__(self):
+        return self.count
+
+    def represent(self, img):
+        """Embed a single face image (file path or BGR array)"""
+        return self.embedder.represent(img)
+
+    def _digest(self, path):
+        # Content hash of an image, only needed when rows are persisted or cached
+        if self.store is None and self.cache is None:
+            return None
+        return file_hash(path)
+
+    def _embed_file(self, path, digest=None):
+        return embed_image(path, self.represent, self.cache, digest)
+
+    def _embed_all(self, paths, digests=None):
+        """Embed image files, returning (paths, embeddings, content hashes) of those that worked"""
+        digests = digests or {}
+        embeddings = []
+        embedded = []
+        hashes = []
+        for path in paths:
+            try:
+                digest = digests.get(path) or self._digest(path)
+                embeddings.append(self._embed_file(path, digest))
+                embedded.append(path)
+                hashes.append(digest)
+            except Exception as e:
+                print(f"Error embedding {path}: {e}")
+        return embedded, embeddings, hashes
+
+    def _replace(self, embeddings, identities):
+        with self.lock:
+            self._set(embeddings, identities)
+
+    def _set(self, embeddings, identities):
+        # Called with the lock held
+        self.embeddings = embeddings
+        self.identities = identities
+        self.count = sum(1 for identity in identities if identity is not None)
+        self._index = None
+        self._version += 1
+
+    def _open_store(self):
+        # (embeddings, identities) of the saved store, or None if there is none to reuse
+        if self.store is None or not self.store.exists():
+            return None
+        try:
+            return self.store.open()
+        except ValueError as e:
+            print(f"Rebuilding the embedding store: {e}")
+            return None
+
+    def load(self, db_path):
+        """Fill the gallery with every image under db_path/<name>/
+
+        With a store, the saved matrix is memory-mapped and only images the store does not
+        know yet, or whose content hash changed, are embedded; rows of images that no longer
+        exist are tombstoned.
+        """
+        with self.load_lock:
+            return self._load(db_path)
+
+    def _load(self, db_path):
+        on_disk = scan_images(db_path)
+
+        stored = self._open_store()
+        if stored is not None:
+            embeddings, identities = stored
+            stored_hashes = self.store.hashes
+            on_disk_set = set(on_disk)
+
+            gone = set(stored_hashes) - on_disk_set
+            for path in gone:
+                self.store.delete(path)
+
+            # Known images are re-embedded when their contents changed since they were stored
+            digests = {}
+            for path in on_disk:
+                try:
+                    digests[path] = file_hash(path)
+                except OSError as e:
+                    print(f"Error reading {path}: {e}")
+            todo = [path for path in on_disk if path not in stored_hashes or stored_hashes[path] != digests.get(path)]
+
+            paths, new_embeddings, hashes = self._embed_all(todo, digests)
+            if paths:
+                # The old row of a changed image goes first, so its new row is the live one
+                for path in paths:
+                    if path in stored_hashes:
+                        self.store.delete(path)
+                self.store.append(paths, new_embeddings, hashes)
+            if gone or paths:
+                embeddings, identities = self.store.open()
+
+            # Tombstoned rows only cost memory and scan time; drop them once there are many
+            deleted = sum(1 for identity in identities if identity is None)
+            if deleted and deleted >= self.compact_ratio * len(identities):
+                self.store.compact()
+                embeddings, identities = self.store.open()
+        else:
+            identities, embeddings, hashes = self._embed_all(on_disk)
+            if self.store is not None:
+                self.store.rewrite(identities, embeddings, hashes)
+                embeddings, identities = self.store.open()
+            elif embeddings:
+                embeddings = np.vstack(embeddings)
+            else:
+                embeddings = np.zeros((0, 0), dtype=np.float32)
+
+        self._replace(embeddings, identities)
+        # Build the index (k-means for "ivf" can take seconds) before reporting the gallery as loaded
+        self.index()
+        self.loaded.set()
+        return self.count
+
+    def add(self, path, embedding=None):
+        """Append one enrolled image to the gallery, embedding it unless an embedding is given
+
+        An image enrolled again under the same path replaces its earlier row.
+        """
+        digest = self._digest(path) if os.path.exists(path) else None
+        if embedding is None:
+            embedding = self._embed_file(path, digest)
+        row = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+
+        # Arrays are replaced rather than modified so in-flight searches keep a consistent snapshot
+        with self.load_lock, self.lock:
+            self._tombstone(path)
+            if self.store is not None:
+                try:
+                    self.store.append([path], row, [digest])
+                    self.embeddings = self.store.matrix(len(self.identities) + 1)
+                except StoreRewritten:
+                    # index_faces.py replaced the store: switch to its rows, then enroll on top of them
+                    self._set(*self.store.open())
+                    self._tombstone(path)
+                    self.store.append([path], row, [digest])
+                    self.embeddings = self.store.matrix(len(self.identities) + 1)
+            elif self.identities:
+                self.embeddings = np.vstack([self.embeddings, row])
+            else:
+                self.embeddings = row
+            self.identities = self.identities + [path]
+            self.count += 1
+            self._version += 1
+
+            # Insert into the existing index; when it is time to switch from exact search to the
+            # approximate index, or to retrain the approximate one, the extended index keeps
+            # answering searches while a new one is built in the background
+            if self._index is None:
+                rebuild = True
+            elif isinstance(self._index, IVFIndex):
+                rebuild = self._index.needs_retraining(self.count)
+                self._index = self._index.extended(self.embeddings, self.identities, retrain=False)
+            else:
+                rebuild = self.index_type != "exact" and isinstance(self._index, ExactIndex) and self.count >= self.ann_min_size
+                self._index = self._index.extended(self.embeddings, self.identities)
+            if rebuild:
+                self._index_stale = True
+
+        if rebuild:
+            self.builder.submit(self._build_index)
+
+    def remove(self, path):
+        """Tombstone every gallery row that came from the given image, returning how many were removed"""
+        with self.load_lock, self.lock:
+            return self._tombstone(path)
+
+    def _tombstone(self, path):
+        # Called with the lock held
+        path = os.path.normpath(path)
+        rows = [i for i, identity in enumerate(self.identities)
+                if identity is not None and os.path.normpath(identity) == path]
+        if rows:
+            identities = list(self.identities)
+            for i in rows:
+                if self.store is not None:
+                    self.store.delete(identities[i])
+                identities[i] = None
+            self.identities = identities
+            self.count -= len(rows)
+            self._version += 1
+            if self._index is not None:
+                self._index = self._index.relabeled(identities)
+        return len(rows)
+
+    def index(self):
+        """Search index over the current gallery, built on first use after a (re)load"""
+        index = self._index
+        if index is None:
+            index = self._build_index()
+        return index
+
+    def _build_index(self):
+        # Builds from a snapshot without holding self.lock, so enrollment and searches on the
+        # current index go on meanwhile; a snapshot that changed during the build is rebuilt
+        with self.build_lock:
+            while True:
+                with self.lock:
+                    if self._index is not None and not self._index_stale:
+                        return self._index
+                    version = self._version
+                    embeddings, identities = self.embeddings, self.identities
+
+                prenormalized = self.store is not None and self.store.normalize
+                options = dict(self.index_options)
+                if self.index_type == "prototype":
+                    # Prototypes are grouped per person, i.e. per <db_path>/<name>/ folder
+                    options.setdefault('group_of', identity_name)
+                index = build_index(
+                    self.index_type, embeddings, identities, self.distance_metric,
+                    prenormalized, self.ann_min_size, **options
+                )
+
+                with self.lock:
+                    if self._version == version:
+                        self._index = index
+                        self._index_stale = False
+                        return index
+
+    def search(self, embeddings, k=1):
+        """Top-k (name, distance, path) matches for each probe embedding, closest first"""
+        results = self.index().search(embeddings, k)
+        return [[(identity_name(path), distance, path) for path, distance in matches] for matches in results]
+
+    def match(self, embedding):
+        """Return (name, distance, path) of the closest gallery row, or None if the gallery is empty"""
+        matches = self.search([embedding], k=1)[0]
+        return matches[0] if matches else None
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Bulk face indexing
+Builds the embedding store for a whole face database outside the web server: images are embedded
+in parallel worker processes and the store is replaced atomically
+
+    python index_faces.py --db face_database --workers 2
+
+Images are enrolled exactly as the app enrolls them (gallery.embed_image: the configured detector
+backend through DeepFace, via the content-hash embedding cache), so a full re-index only embeds
+images the cache has not seen. Each worker process loads its own copy of the model.
+
+Run it from the directory the app runs in, so the stored image paths match the ones the app
+scans. A running app keeps serving the gallery it loaded and switches to the new store on its
+next enrollment or restart.
+"""
+
+import os
+import time
+import argparse
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from gallery import scan_images, embed_image
+from embedding_store import EmbeddingStore
+from embedding_cache import EmbeddingCache, file_hash
+
+_embedder = None
+_cache = None
+
+
+def init_worker(model_name, detector_backend, cache_root, cache_bytes):
+    """Load the model once per worker process"""
+    global _embedder, _cache
+    from embedder import FaceEmbedder
+    _embedder = FaceEmbedder(model_name, detector_backend).warm_up()
+    if cache_root:
+        _cache = EmbeddingCache(cache_root, model_name, detector_backend, cache_bytes)
+
+
+def embed_path(path):
+    """Embed one image in a worker; returns (path, embedding, content hash)
+
+    embedding is None if the image could not be embedded.
+    """
+    try:
+        digest = file_hash(path)
+        return path, embed_image(path, _embedder.represent, _cache, digest), digest
+    except Exception as e:
+        print(f"Error embedding {path}: {e}", flush=True)
+        return path, None, None
+
+
+class Progress:
+    """Prints processed / total, throughput and time left every interval seconds"""
+
+    def __init__(self, total, interval=2.0):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self.reported_at = self.started
+
+    def update(self, done, failed=0, force=False):
+        self.done += done
+        self.failed += failed
+        now = time.perf_counter()
+        if not force and now - self.reported_at < self.interval:
+            return
+        self.reported_at = now
+
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0
+        remaining = (self.total - self.done) / rate if rate > 0 else 0
+        print(f"{self.done}/{self.total} images, {self.failed} failed, "
+              f"{rate:.1f} images/s, {remaining:.0f}s left", flush=True)
+
+
+def stored_rows(store, on_disk):
+    """(paths, embeddings, hashes) of stored rows whose image is still on disk, unchanged"""
+    try:
+        embeddings, identities = store.open()
+    except ValueError as e:
+        print(f"Ignoring the existing store: {e}")
+        return [], [], []
+
+    paths = []
+    kept = []
+    hashes = []
+    wanted = set(on_disk)
+    for row, path in enumerate(identities):
+        if path is None or path not in wanted:
+            continue
+        try:
+            digest = file_hash(path)
+        except OSError:
+            continue
+        if store.hashes.get(path) == digest:
+            paths.append(path)
+            kept.append(np.asarray(embeddings[row], dtype=np.float32))
+            hashes.append(digest)
+    return paths, kept, hashes
+
+
+def index_faces(args):
+    store = EmbeddingStore(args.store, args.model, args.detector, dtype=args.dtype,
+                           normalize=args.metric != "euclidean")
+    on_disk = scan_images(args.db)
+
+    # Keep the rows of unchanged images the store already has, unless a full re-index was asked for
+    kept_paths, kept_embeddings, kept_hashes = [], [], []
+    if args.incremental and store.exists():
+        kept_paths, kept_embeddings, kept_hashes = stored_rows(store, on_disk)
+    known = set(kept_paths)
+    todo = [path for path in on_disk if path not in known]
+    print(f"{len(on_disk)} images in {args.db}: {len(kept_paths)} already indexed, {len(todo)} to embed")
+
+    progress = Progress(len(todo))
+    paths = []
+    embeddings = []
+    hashes = []
+    if todo:
+        print(f"Starting {args.workers} workers with {args.model}...", flush=True)
+        cache_root = None if args.no_cache else args.cache
+        # Spawned, not forked, so workers never inherit model threads; each loads the model itself
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=get_context('spawn'),
+                                 initializer=init_worker,
+                                 initargs=(args.model, args.detector, cache_root, args.cache_bytes)) as pool:
+            for path, embedding, digest in pool.map(embed_path, todo, chunksize=args.chunk_size):
+                if embedding is None:
+                    progress.update(1, failed=1)
+                    continue
+                paths.append(path)
+                embeddings.append(embedding)
+                hashes.append(digest)
+                progress.update(1)
+    progress.update(0, force=True)
+
+    all_paths = kept_paths + paths
+    all_embeddings = kept_embeddings + embeddings
+    store.rewrite(all_paths, np.vstack(all_embeddings) if all_embeddings else np.zeros((0, 0), dtype=np.float32),
+                  kept_hashes + hashes)
+
+    elapsed = time.perf_counter() - progress.started
+    print(f"Indexed {len(paths)} new images ({len(all_paths)} total) in {elapsed:.1f}s, "
+          f"{len(paths) / elapsed if elapsed > 0 else 0:.1f} images/s; store written to {store.matrix_path}")
+    return len(all_paths)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Embed a whole face database into the gallery store")
+    parser.add_argument('--db', default="face_database", help="Face database laid out as <db>/<name>/<image>")
+    parser.add_argument('--store', default="embeddings", help="Embedding store directory")
+    parser.add_argument('--cache', default=os.path.join("embeddings", "cache"), help="Content-hash embedding cache directory")
+    parser.add_argument('--cache-bytes', type=int, default=512 * 1024 * 1024, help="Disk budget of the embedding cache")
+    parser.add_argument('--no-cache', action='store_true', help="Embed every image, bypassing the embedding cache")
+    parser.add_argument('--model', default="VGG-Face")
+    parser.add_argument('--detector', default="opencv", help="Detector backend faces are found with")
+    parser.add_argument('--metric', default="cosine", help="Distance metric the app uses (decides row normalization)")
+    parser.add_argument('--dtype', default="float32", help="float32 or float16")
+    parser.add_argument('--workers', type=int, default=2, help="Embedding processes, each with its own model")
+    parser.add_argument('--chunk-size', type=int, default=16, help="Images handed to a worker at a time")
+    parser.add_argument('--incremental', action='store_true', help="Keep rows of unchanged images the store already has")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    index_faces(parse_args())
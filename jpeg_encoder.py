@@ -0,0 +1,53 @@
+"""
+MJPEG frame encoding
+Scales and JPEG-encodes output frames, using libjpeg-turbo through PyTurboJPEG when it is installed
+"""
+
+import cv2
+
+try:
+    from turbojpeg import TurboJPEG
+except ImportError:
+    TurboJPEG = None
+
+JPEG_BACKENDS = ("auto", "opencv", "turbojpeg")
+
+
+class JpegEncoder:
+    """Encodes BGR frames at a given JPEG quality and output scale"""
+
+    def __init__(self, quality=80, scale=1.0, backend="auto"):
+        if backend not in JPEG_BACKENDS:
+            raise ValueError(f"Unsupported JPEG backend: {backend}")
+
+        self.quality = quality  # 1-100; lower is smaller and faster to send
+        self.scale = scale  # Output frames are resized by this factor before encoding
+
+        # "auto" uses turbojpeg when both the package and the native library are available
+        self.turbo = None
+        if backend != "opencv":
+            if TurboJPEG is None:
+                if backend == "turbojpeg":
+                    raise ImportError("PyTurboJPEG is not installed")
+            else:
+                try:
+                    self.turbo = TurboJPEG()
+                except (OSError, RuntimeError):
+                    if backend == "turbojpeg":
+                        raise
+        self.backend = "turbojpeg" if self.turbo is not None else "opencv"
+
+    def encode(self, frame):
+        """JPEG bytes of a BGR frame"""
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale,
+                               interpolation=cv2.INTER_AREA if self.scale < 1.0 else cv2.INTER_LINEAR)
+
+        if self.turbo is not None:
+            return self.turbo.encode(frame, quality=int(self.quality))
+
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+        return buffer.tobytes()
+
+    def settings(self):
+        return {'jpeg_quality': self.quality, 'scale': self.scale, 'jpeg_backend': self.backend}
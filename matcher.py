@@ -0,0 +1,122 @@
+"""
+Vectorized embedding matcher
+Scores a batch of probe embeddings against a whole gallery with one matrix product
+"""
+
+import copy
+import numpy as np
+
+DISTANCE_METRICS = ("cosine", "euclidean", "euclidean_l2")
+
+
+def l2_normalize(embeddings):
+    """Scale every row to unit length (zero rows are left untouched)"""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+class EmbeddingMatcher:
+    """Gallery matrix prepared once for the chosen distance metric"""
+
+    def __init__(self, embeddings, labels, distance_metric="cosine", prenormalized=False):
+        if distance_metric not in DISTANCE_METRICS:
+            raise ValueError(f"Unsupported distance metric: {distance_metric}")
+
+        self.distance_metric = distance_metric
+        self.prenormalized = prenormalized
+        self._set_labels(labels)
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2:
+            embeddings = embeddings.reshape(len(self.labels), -1)
+
+        # cosine and euclidean_l2 only depend on the direction of each embedding,
+        # so the gallery is normalized here once instead of on every probe
+        # (rows that are already unit length, e.g. from a normalized store, are used as they are)
+        if distance_metric == "euclidean":
+            self.gallery = embeddings
+            self.gallery_sq_norms = np.einsum('ij,ij->i', embeddings, embeddings)
+        else:
+            self.gallery = embeddings if prenormalized else l2_normalize(embeddings)
+            self.gallery_sq_norms = None
+
+    def _set_labels(self, labels):
+        self.labels = list(labels)
+
+        # Rows labelled None are deleted and never returned
+        self.valid = np.array([label is not None for label in self.labels], dtype=bool)
+        self.valid_count = int(self.valid.sum())
+
+    def __len__(self):
+        return self.valid_count
+
+    def extended(self, embeddings, labels):
+        """Matcher for the same gallery after rows were appended, preparing only the new rows"""
+        matcher = copy.copy(self)
+        matcher._set_labels(labels)
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        rows = embeddings[len(self.labels):]
+        if self.distance_metric == "euclidean":
+            matcher.gallery = embeddings
+            matcher.gallery_sq_norms = np.concatenate([self.gallery_sq_norms, np.einsum('ij,ij->i', rows, rows)])
+        elif self.prenormalized:
+            matcher.gallery = embeddings
+        else:
+            matcher.gallery = np.vstack([self.gallery, l2_normalize(rows)])
+        return matcher
+
+    def relabeled(self, labels):
+        """Matcher for the same rows with new labels, e.g. after rows were deleted"""
+        matcher = copy.copy(self)
+        matcher._set_labels(labels)
+        return matcher
+
+    def prepare_probes(self, probes):
+        """Probes in the space the gallery rows live in (unit length unless the metric is euclidean)"""
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        if self.distance_metric == "euclidean":
+            return probes
+        return l2_normalize(probes)
+
+    def distances(self, probes, rows=None):
+        """(probes x gallery) distance matrix, or (probes x rows) for a subset of row indexes"""
+        probes = self.prepare_probes(probes)
+        gallery = self.gallery if rows is None else self.gallery[rows]
+
+        if self.distance_metric == "euclidean":
+            gallery_sq_norms = self.gallery_sq_norms if rows is None else self.gallery_sq_norms[rows]
+            probe_sq_norms = np.einsum('ij,ij->i', probes, probes)
+            sq = probe_sq_norms[:, None] + gallery_sq_norms[None, :] - 2 * (probes @ gallery.T)
+            return np.sqrt(np.maximum(sq, 0))
+
+        similarity = probes @ gallery.T
+        if self.distance_metric == "cosine":
+            return 1 - similarity
+        return np.sqrt(np.maximum(2 - 2 * similarity, 0))
+
+    def top_k(self, distances, k, rows=None):
+        """Closest (label, distance) pairs of one row of distances, skipping deleted rows"""
+        rows = np.arange(len(distances)) if rows is None else np.asarray(rows)
+        valid = self.valid[rows]
+        if not valid.all():
+            distances = distances[valid]
+            rows = rows[valid]
+
+        k = min(k, len(rows))
+        if k == 0:
+            return []
+
+        # argpartition finds the k best columns without sorting the whole row
+        columns = np.argpartition(distances, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        columns = columns[np.argsort(distances[columns])]
+        return [(self.labels[rows[i]], float(distances[i])) for i in columns]
+
+    def search(self, probes, k=1):
+        """Top-k (label, distance) pairs for every probe, closest first"""
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        if self.valid_count == 0:
+            return [[] for _ in range(len(probes))]
+
+        return [self.top_k(row, k) for row in self.distances(probes)]
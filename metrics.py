@@ -0,0 +1,204 @@
+"""
+Pipeline metrics
+Counters, gauges and latency histograms rendered in the Prometheus text format
+"""
+
+import time
+import bisect
+import threading
+
+# Seconds; spans a fast imencode up to a slow recognition batch
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """One metric family, optionally split by a single label (e.g. stage="detect")"""
+
+    kind = None
+
+    def __init__(self, registry, name, help_text, label=None):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.lock = threading.Lock()
+
+    def _labels(self, label_value):
+        return ((self.label, label_value),) if self.label and label_value is not None else ()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    """Monotonic count; function, if given, is read at scrape time instead"""
+
+    kind = 'counter'
+
+    def __init__(self, registry, name, help_text, label=None, function=None):
+        super().__init__(registry, name, help_text, label)
+        self.function = function
+        self.values = {}
+
+    def inc(self, amount=1, label_value=None):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        if self.function is not None:
+            return [f'{self.name} {_format_value(self.function())}']
+        with self.lock:
+            values = dict(self.values)
+        return [f'{self.name}{_format_labels(self._labels(label))} {_format_value(value)}'
+                for label, value in values.items()]
+
+
+class Gauge(Metric):
+    """Current value; function, if given, is read at scrape time so the hot path never updates it"""
+
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help_text, label=None, function=None):
+        super().__init__(registry, name, help_text, label)
+        self.function = function
+        self.values = {}
+
+    def set(self, value, label_value=None):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[label_value] = value
+
+    def render(self):
+        if self.function is not None:
+            return [f'{self.name} {_format_value(self.function())}']
+        with self.lock:
+            values = dict(self.values)
+        return [f'{self.name}{_format_labels(self._labels(label))} {_format_value(value)}'
+                for label, value in values.items()]
+
+
+class Histogram(Metric):
+    """Bucketed distribution of observed values, e.g. stage latencies in seconds"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, label=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, label)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label value -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, label_value=None):
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def since(self, started, label_value=None):
+        """Observe the time elapsed since started (a Metrics.clock() value) and return the current clock"""
+        if not self.registry.enabled:
+            return 0.0
+        now = time.perf_counter()
+        self.observe(now - started, label_value)
+        return now
+
+    def render(self):
+        with self.lock:
+            series = {label: list(values) for label, values in self.series.items()}
+
+        lines = []
+        for label_value, values in series.items():
+            labels = self._labels(label_value)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(labels + (("le", _format_value(float(bound))),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(values[-1])}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {cumulative}')
+        return lines
+
+
+class FrameRate:
+    """Frames per second, smoothed over recent frame intervals"""
+
+    def __init__(self, registry, smoothing=0.1):
+        self.registry = registry
+        self.smoothing = smoothing
+        self.last = None
+        self.interval = None
+
+    def tick(self):
+        if not self.registry.enabled:
+            return
+        now = time.perf_counter()
+        if self.last is not None:
+            elapsed = now - self.last
+            self.interval = elapsed if self.interval is None else (
+                (1 - self.smoothing) * self.interval + self.smoothing * elapsed)
+        self.last = now
+
+    def value(self):
+        if not self.interval:
+            return 0.0
+        return 1.0 / self.interval
+
+
+class Metrics:
+    """Registry of metric families; while disabled every update returns immediately"""
+
+    def __init__(self, enabled=True, namespace=None):
+        self.enabled = enabled
+        self.namespace = namespace
+        self.metrics = []
+
+    def _name(self, name):
+        return f'{self.namespace}_{name}' if self.namespace else name
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def clock(self):
+        """Start time for Histogram.since(); free while metrics are disabled"""
+        return time.perf_counter() if self.enabled else 0.0
+
+    def counter(self, name, help_text, label=None, function=None):
+        return self._register(Counter(self, self._name(name), help_text, label, function))
+
+    def gauge(self, name, help_text, label=None, function=None):
+        return self._register(Gauge(self, self._name(name), help_text, label, function))
+
+    def histogram(self, name, help_text, label=None, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, self._name(name), help_text, label, buckets))
+
+    def frame_rate(self, name, help_text, smoothing=0.1):
+        rate = FrameRate(self, smoothing)
+        self.gauge(name, help_text, function=rate.value)
+        return rate
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
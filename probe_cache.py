@@ -0,0 +1,70 @@
+"""
+Short-lived probe cache
+Reuses the recognition result of a face crop that looks the same, at about the same place, as one recognized moments ago
+"""
+
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+
+def difference_hash(face_img, hash_size=8):
+    """64-bit perceptual hash: brightness gradients of the crop shrunk to (hash_size + 1) x hash_size"""
+    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY) if face_img.ndim == 3 else face_img
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class ProbeCache:
+    """LRU of recent (perceptual hash, box) -> recognition result, valid for ttl seconds
+
+    Two probes match when their hashes differ in at most max_hash_distance bits and their box
+    centres are within position_tolerance box widths of each other.
+    """
+
+    def __init__(self, ttl=0.5, max_size=64, max_hash_distance=6, position_tolerance=0.2, hash_size=8):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_hash_distance = max_hash_distance
+        self.position_tolerance = position_tolerance
+        self.hash_size = hash_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (stored_at, result), oldest first
+
+    def key(self, face_img, box):
+        """Cache key of a face crop taken from box (x, y, w, h)"""
+        x, y, w, h = box
+        return difference_hash(face_img, self.hash_size), x + w / 2, y + h / 2, w
+
+    def _matches(self, key, other):
+        hash_value, cx, cy, w = key
+        other_hash, other_cx, other_cy, other_w = other
+        tolerance = self.position_tolerance * max(w, other_w)
+        return (abs(cx - other_cx) <= tolerance and abs(cy - other_cy) <= tolerance
+                and bin(hash_value ^ other_hash).count('1') <= self.max_hash_distance)
+
+    def get(self, key, now=None):
+        """Result cached for a matching probe within the last ttl seconds, or None"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            for cached_key, (stored_at, _) in list(self.entries.items()):
+                if now - stored_at > self.ttl:
+                    del self.entries[cached_key]
+
+            # Most recently used first
+            match = next((cached_key for cached_key in reversed(self.entries) if self._matches(key, cached_key)), None)
+            if match is None:
+                return None
+            self.entries.move_to_end(match)
+            return self.entries[match][1]
+
+    def put(self, key, result, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (now, result)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
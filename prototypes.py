@@ -0,0 +1,168 @@
+"""
+Per-identity prototype matching
+Matches probes against a few prototype embeddings per person instead of every enrolled photo
+"""
+
+import numpy as np
+from matcher import EmbeddingMatcher
+
+PROTOTYPE_METHODS = ("mean", "medoids")
+
+
+def k_medoids(distances, k, iterations=10):
+    """Indexes of k medoids for a small square distance matrix"""
+    n = len(distances)
+    if n <= k:
+        return list(range(n))
+
+    # Farthest-point start: most central row first, then the row farthest from the chosen ones
+    medoids = [int(np.argmin(distances.sum(axis=1)))]
+    while len(medoids) < k:
+        medoids.append(int(np.argmax(distances[:, medoids].min(axis=1))))
+
+    for _ in range(iterations):
+        assignments = np.argmin(distances[:, medoids], axis=1)
+        updated = []
+        for cluster in range(k):
+            members = np.flatnonzero(assignments == cluster)
+            if len(members) == 0:
+                updated.append(medoids[cluster])
+                continue
+            costs = distances[np.ix_(members, members)].sum(axis=1)
+            updated.append(int(members[np.argmin(costs)]))
+        if updated == medoids:
+            break
+        medoids = updated
+    return medoids
+
+
+class PrototypeIndex:
+    """Scores probes against per-identity prototypes, so search cost follows the number of people
+
+    When the best prototype distance is within margin of the threshold, the probe is verified
+    exactly against every photo of the candidate identities.
+    """
+
+    def __init__(self, embeddings, labels, distance_metric="cosine", prenormalized=False, group_of=None,
+                 method="mean", prototypes_per_identity=3, threshold=0.4, margin=0.1):
+        if method not in PROTOTYPE_METHODS:
+            raise ValueError(f"Unsupported prototype method: {method}")
+
+        self.matcher = EmbeddingMatcher(embeddings, labels, distance_metric, prenormalized)
+        self.group_of = group_of or (lambda label: label)  # Maps a row label (image path) to its identity
+        self.method = method
+        self.prototypes_per_identity = prototypes_per_identity
+        self.threshold = threshold
+        self.margin = margin
+
+        self.rows_by_identity = {}
+        for row, label in enumerate(self.matcher.labels):
+            if label is not None:
+                self.rows_by_identity.setdefault(self.group_of(label), []).append(row)
+
+        self.prototypes = {identity: self._prototypes(rows) for identity, rows in self.rows_by_identity.items()}
+        self._build_prototype_matcher()
+
+    def _prototypes(self, rows):
+        # Returns (vectors, representative row) for one identity
+        vectors = np.asarray(self.matcher.gallery[rows], dtype=np.float32)
+
+        if self.method == "mean" or len(rows) == 1:
+            mean = vectors.mean(axis=0, keepdims=True)
+            # The photo closest to the mean stands in for the identity in results
+            closest = int(np.argmin(self.matcher.distances(mean, rows)[0]))
+            return mean, rows[closest]
+
+        distances = self.matcher.distances(vectors, rows)
+        medoids = k_medoids(distances, self.prototypes_per_identity)
+        return vectors[medoids], rows[medoids[0]]
+
+    def _build_prototype_matcher(self):
+        # Prototypes of one identity are contiguous, starting at prototype_offsets[i]
+        vectors = []
+        self.prototype_identities = []
+        self.identity_names = []
+        offsets = []
+        for identity, (prototype_vectors, _) in self.prototypes.items():
+            offsets.append(len(self.prototype_identities))
+            vectors.append(prototype_vectors)
+            self.identity_names.append(identity)
+            self.prototype_identities.extend([identity] * len(prototype_vectors))
+        self.prototype_offsets = np.array(offsets, dtype=np.int64)
+
+        dim = self.matcher.gallery.shape[1] if self.matcher.gallery.ndim == 2 else 0
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, dim), dtype=np.float32)
+        self.prototype_matcher = EmbeddingMatcher(matrix, self.prototype_identities, self.matcher.distance_metric)
+
+    def __len__(self):
+        return len(self.matcher)
+
+    def _copy(self, matcher):
+        index = PrototypeIndex.__new__(PrototypeIndex)
+        index.__dict__.update(self.__dict__)
+        index.matcher = matcher
+        index.rows_by_identity = {identity: list(rows) for identity, rows in self.rows_by_identity.items()}
+        index.prototypes = dict(self.prototypes)
+        return index
+
+    def _refresh(self, identities):
+        # Recompute prototypes only for the people whose photos changed
+        for identity in identities:
+            rows = self.rows_by_identity.get(identity)
+            if rows:
+                self.prototypes[identity] = self._prototypes(rows)
+            else:
+                self.rows_by_identity.pop(identity, None)
+                self.prototypes.pop(identity, None)
+        self._build_prototype_matcher()
+
+    def extended(self, embeddings, labels):
+        """Index after photos were added; only the affected identities get new prototypes"""
+        index = self._copy(self.matcher.extended(embeddings, labels))
+        changed = set()
+        for row in range(len(self.matcher.labels), len(index.matcher.labels)):
+            label = index.matcher.labels[row]
+            if label is not None:
+                identity = self.group_of(label)
+                index.rows_by_identity.setdefault(identity, []).append(row)
+                changed.add(identity)
+        index._refresh(changed)
+        return index
+
+    def relabeled(self, labels):
+        """Index after photos were deleted; only the affected identities get new prototypes"""
+        index = self._copy(self.matcher.relabeled(labels))
+        changed = set()
+        for identity, rows in index.rows_by_identity.items():
+            alive = [row for row in rows if index.matcher.labels[row] is not None]
+            if len(alive) != len(rows):
+                index.rows_by_identity[identity] = alive
+                changed.add(identity)
+        index._refresh(changed)
+        return index
+
+    def search(self, probes, k=1):
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        if len(self.prototype_identities) == 0:
+            return [[] for _ in range(len(probes))]
+
+        # Best prototype distance per identity, for every probe at once
+        best = np.minimum.reduceat(self.prototype_matcher.distances(probes), self.prototype_offsets, axis=1)
+        k = min(k, len(self.identity_names))
+
+        results = []
+        for probe, distances in zip(probes, best):
+            columns = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+            columns = columns[np.argsort(distances[columns])]
+
+            matches = []
+            for column in columns:
+                identity, distance = self.identity_names[column], float(distances[column])
+                rows = self.rows_by_identity[identity]
+                if abs(distance - self.threshold) <= self.margin:
+                    # Borderline: verify against every photo of this person
+                    matches.extend(self.matcher.top_k(self.matcher.distances(probe, rows)[0], 1, rows))
+                else:
+                    matches.append((self.matcher.labels[self.prototypes[identity][1]], distance))
+            results.append(sorted(matches, key=lambda match: match[1])[:k])
+        return results
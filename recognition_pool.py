@@ -0,0 +1,126 @@
+"""
+Asynchronous face recognition
+Runs recognition on a worker pool so the frame loop never waits on the model
+"""
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RecognitionPool:
+    """Recognizes face crops in batches on worker threads and keeps the latest result for each track"""
+
+    def __init__(self, recognize_batch, max_workers=None, on_result=None, max_batch=16, batch_wait=0.005):
+        # recognize_batch(face_imgs) returns one result per face
+        self.recognize_batch = recognize_batch
+        # on_result(track_id, result) is called from the worker thread when a result is ready
+        self.on_result = on_result
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_batch = max_batch  # Most crops recognized in one forward pass
+        self.batch_wait = batch_wait  # Seconds to wait for more crops once a batch has started
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='recognition')
+        self.lock = threading.Lock()
+        self.results = {}
+        self.pending = {}
+
+        # Crops wait here while every worker is busy, so the next batch picks up all of them
+        self.queue = queue.Queue()
+        self.idle_workers = threading.Semaphore(self.max_workers)
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, track_id, face_img):
+        """Queue a crop for recognition unless this track already has one in flight"""
+        with self.lock:
+            if track_id in self.pending:
+                return False
+            job = object()
+            self.pending[track_id] = job
+
+        self.queue.put((track_id, job, face_img))
+        return True
+
+    def _dispatch(self):
+        while True:
+            batch = [self.queue.get()]
+            self.idle_workers.acquire()
+
+            # Collect everything that queued up, plus whatever arrives within the batch window,
+            # so crops from several faces, frames or cameras share one forward pass
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            # Skip crops of tracks that were forgotten while they waited
+            with self.lock:
+                batch = [item for item in batch if self.pending.get(item[0]) is item[1]]
+
+            if batch:
+                self.executor.submit(self._run, batch)
+            else:
+                self.idle_workers.release()
+
+    def _run(self, batch):
+        try:
+            try:
+                results = self.recognize_batch([face_img for _, _, face_img in batch])
+            except Exception as e:
+                print(f"Error during face recognition: {e}")
+                results = [e] * len(batch)
+
+            for (track_id, job, _), result in zip(batch, results):
+                self._finish(track_id, job, result)
+        finally:
+            self.idle_workers.release()
+
+    def _finish(self, track_id, job, result):
+        with self.lock:
+            # Only keep results for tracks that are still being followed
+            if self.pending.get(track_id) is not job:
+                return
+            del self.pending[track_id]
+            self.results[track_id] = result
+
+        if self.on_result is not None:
+            self.on_result(track_id, result)
+
+    def has_result(self, track_id):
+        with self.lock:
+            return track_id in self.results
+
+    def result(self, track_id, default=None):
+        """Most recent result for a track (an Exception if recognition failed)"""
+        with self.lock:
+            return self.results.get(track_id, default)
+
+    def queue_depth(self):
+        """Number of crops submitted but not yet recognized"""
+        with self.lock:
+            return len(self.pending)
+
+    def forget(self, active_track_ids, owner=None):
+        """Drop results and pending jobs of tracks that are no longer visible
+
+        When several cameras share the pool their track ids are (owner, track_id) pairs,
+        and only the given owner's tracks are considered.
+        """
+        active_track_ids = set(active_track_ids)
+
+        def stale(track_id):
+            if owner is not None and not (isinstance(track_id, tuple) and track_id[0] == owner):
+                return False
+            return track_id not in active_track_ids
+
+        with self.lock:
+            for track_id in list(self.results):
+                if stale(track_id):
+                    del self.results[track_id]
+            for track_id in list(self.pending):
+                if stale(track_id):
+                    del self.pending[track_id]
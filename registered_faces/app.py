@@ -1,6 +1,8 @@
-from flask import Flask, render_template, Response
+from flask import Flask, render_template, Response, jsonify
 import cv2
 from deepface import DeepFace
+import numpy as np
+import threading
 import os
 
 app = Flask(__name__)
@@ -8,9 +10,34 @@ app = Flask(__name__)
 db_path = "rcaptured_faces"
 threshold = 0.4
 
-video_capture = cv2.VideoCapture(0)
+camera_source = 0  # Device index, video file or stream URL
+
+# Opened on the first /video request instead of at import time
+video_capture = None
+video_lock = threading.Lock()
+
+def open_video():
+    global video_capture
+    with video_lock:
+        if video_capture is None or not video_capture.isOpened():
+            video_capture = cv2.VideoCapture(camera_source)
+        return video_capture
+
+# Load the recognition model and detector once at startup instead of inside the first frame
+model_ready = threading.Event()
+
+def warm_up_model():
+    try:
+        DeepFace.build_model("VGG-Face")
+        DeepFace.represent(img_path=np.zeros((224, 224, 3), dtype=np.uint8), enforce_detection=False)
+        model_ready.set()
+    except Exception as e:
+        print(f"Error loading model: {e}")
+
+threading.Thread(target=warm_up_model, daemon=True).start()
 
 def generate_frames():
+    video_capture = open_video()
     while True:
         success, frame = video_capture.read()
         if not success:
@@ -20,6 +47,8 @@ def generate_frames():
             name = "Unknown"
 
             try:
+                if not model_ready.is_set():
+                    raise RuntimeError("Model is still loading")
                 results = DeepFace.find(img_path=frame_rgb, db_path=db_path, enforce_detection=False)
                 if len(results) > 0:
                     best_match = results[0]
@@ -52,5 +81,10 @@ def index():
 def video():
     return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/ready')
+def ready():
+    is_ready = model_ready.is_set()
+    return jsonify({'status': 'ready' if is_ready else 'loading', 'ready': is_ready}), 200 if is_ready else 503
+
 if __name__ == "__main__":
     app.run(debug=True)
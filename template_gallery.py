@@ -0,0 +1,113 @@
+"""
+Preloaded face templates for template-matching recognition
+Holds every database face as a normalized grayscale template in one contiguous array
+"""
+
+import os
+import time
+import threading
+import numpy as np
+import cv2
+
+TEMPLATE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def normalize_template(gray):
+    """Zero-mean, unit-length vector of a grayscale template"""
+    vector = gray.astype(np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class TemplateGallery:
+    """Grayscale templates of the images in a directory, reloaded only when the directory changes"""
+
+    def __init__(self, directory, size=(100, 100), check_interval=1.0, exclude_prefix=None):
+        self.directory = directory
+        self.exclude_prefix = exclude_prefix  # File names starting with this are never matched
+        self.size = size
+        self.check_interval = check_interval  # Seconds between directory change checks
+        self.lock = threading.Lock()
+
+        # One normalized template per row, names[i] is the file name (without extension) of row i
+        self.templates = np.zeros((0, size[0] * size[1]), dtype=np.float32)
+        self.names = []
+        self.signature = None
+        self.checked_at = 0
+
+    def preprocess(self, face_img):
+        """Resize a BGR face to the template size and turn it into a normalized grayscale vector"""
+        face_small = cv2.resize(face_img, self.size)
+        if face_small.ndim == 3:
+            face_small = cv2.cvtColor(face_small, cv2.COLOR_BGR2GRAY)
+        return normalize_template(face_small)
+
+    def _directory_signature(self):
+        # Adding, removing or renaming a file updates the directory mtime
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        """Load every image of the directory into the template array"""
+        templates = []
+        names = []
+        signature = self._directory_signature()
+
+        if signature is not None:
+            for filename in sorted(os.listdir(self.directory)):
+                if not filename.endswith(TEMPLATE_EXTENSIONS):
+                    continue
+                if self.exclude_prefix and filename.startswith(self.exclude_prefix):
+                    continue
+
+                try:
+                    db_face = cv2.imread(os.path.join(self.directory, filename))
+                    if db_face is None:
+                        continue
+                    templates.append(self.preprocess(db_face))
+                    names.append(os.path.splitext(filename)[0])
+                except Exception as e:
+                    print(f"Error processing {filename}: {str(e)}")
+
+        with self.lock:
+            if templates:
+                self.templates = np.ascontiguousarray(np.vstack(templates))
+            else:
+                self.templates = np.zeros((0, self.size[0] * self.size[1]), dtype=np.float32)
+            self.names = names
+            self.signature = signature
+
+    def refresh(self):
+        """Reload the templates if the directory changed since they were loaded"""
+        now = time.monotonic()
+        if self.signature is not None and now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+
+        if self._directory_signature() != self.signature or self.signature is None:
+            self.reload()
+
+    def scores(self, face_img):
+        """Normalized cross-correlation of a face against every template"""
+        self.refresh()
+        with self.lock:
+            templates = self.templates
+            names = self.names
+
+        # For two images of the same size TM_CCOEFF_NORMED is the dot product of their
+        # zero-mean, unit-length vectors, so all templates are scored in one product
+        return templates @ self.preprocess(face_img), names
+
+    def match(self, face_img, threshold=0.6):
+        """Return (name, score) of the best template above the threshold, or (None, 0)"""
+        scores, names = self.scores(face_img)
+        if not names:
+            return None, 0
+
+        best = int(np.argmax(scores))
+        if scores[best] > threshold:
+            return names[best], float(scores[best])
+        return None, 0
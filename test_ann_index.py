@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from ann_index import ExactIndex, IVFIndex, build_index
+from matcher import DISTANCE_METRICS
+
+
+def assert_same(results, expected):
+    for matches, reference in zip(results, expected):
+        assert [label for label, _ in matches] == [label for label, _ in reference]
+        np.testing.assert_allclose([d for _, d in matches], [d for _, d in reference], rtol=1e-5, atol=1e-6)
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    gallery = rng.standard_normal((200, 16)).astype(np.float32)
+    probes = rng.standard_normal((10, 16)).astype(np.float32)
+    return gallery, [f"row{i}" for i in range(len(gallery))], probes
+
+
+@pytest.mark.parametrize("metric", DISTANCE_METRICS)
+def test_ivf_scanning_every_bucket_is_exact(data, metric):
+    gallery, labels, probes = data
+    index = IVFIndex(gallery, labels, metric, nlist=8, nprobe=8)
+    assert index.nlist == 8
+    assert_same(index.search(probes, k=5), ExactIndex(gallery, labels, metric).search(probes, k=5))
+
+
+def test_ivf_never_returns_deleted_rows(data):
+    gallery, labels, probes = data
+    index = IVFIndex(gallery[:150], labels[:150], nlist=8, nprobe=8)
+    # Rows appended without retraining go into existing buckets
+    index = index.extended(gallery, labels, retrain=False)
+
+    deleted = list(labels)
+    for row in range(0, len(deleted), 4):
+        deleted[row] = None
+    index = index.relabeled(deleted)
+
+    results = index.search(probes, k=10)
+    assert_same(results, ExactIndex(gallery, deleted).search(probes, k=10))
+    assert all(label in deleted for matches in results for label, _ in matches)
+    # A deleted row is not even its own nearest neighbour
+    assert all(label != labels[0] for label, _ in index.search(gallery[0], k=10)[0])
+
+
+def test_build_index_uses_exact_search_below_min_size(data):
+    gallery, labels, _ = data
+    assert isinstance(build_index("ivf", gallery, labels, min_size=1000), ExactIndex)
+    assert isinstance(build_index("ivf", gallery, labels, min_size=100, nlist=4), IVFIndex)
@@ -0,0 +1,87 @@
+import numpy as np
+from embedding_store import EmbeddingStore
+
+
+def test_append_after_unindexed_rows(tmp_path):
+    store = EmbeddingStore(str(tmp_path), normalize=False)
+    store.rewrite(['a', 'b'], [[1, 0], [0, 1]])
+
+    # A crash after writing a row but before indexing it
+    with open(store.matrix_path, 'ab') as f:
+        f.write(np.array([[9, 9]], dtype=np.float32).tobytes())
+
+    store.append(['c'], [[5, 5]])
+    embeddings, identities = store.open()
+    assert identities == ['a', 'b', 'c']
+    np.testing.assert_array_equal(embeddings[2], [5, 5])
+
+
+def test_metric_change_does_not_reuse_rows(tmp_path):
+    EmbeddingStore(str(tmp_path), normalize=True).rewrite(['a'], [[3, 4]])
+
+    raw = EmbeddingStore(str(tmp_path), normalize=False)
+    assert not raw.exists()
+    raw.rewrite(['a'], [[3, 4]])
+    embeddings, _ = raw.open()
+    np.testing.assert_array_equal(embeddings[0], [3, 4])
+
+    unit, _ = EmbeddingStore(str(tmp_path), normalize=True).open()
+    np.testing.assert_allclose(unit[0], [0.6, 0.8])
+
+
+def test_delete_removes_every_row_of_a_path(tmp_path):
+    store = EmbeddingStore(str(tmp_path), normalize=False)
+    store.rewrite(['db/a/1.jpg'], [[1, 0]])
+    store.open()
+    store.append(['db/a/1.jpg'], [[0, 1]])
+    store.delete('db/a/1.jpg')
+
+    _, identities = store.open()
+    assert identities == [None, None]
+
+
+def test_gallery_reenrollment_replaces_the_row(tmp_path):
+    from gallery import EmbeddingGallery
+
+    store = EmbeddingStore(str(tmp_path), normalize=False)
+    gallery = EmbeddingGallery(None, "euclidean", store)
+    gallery.load(str(tmp_path / "db"))
+    gallery.add('db/a/1.jpg', [1, 0])
+    gallery.add('db/a/1.jpg', [0, 1])
+    assert len(gallery) == 1
+    np.testing.assert_array_equal(gallery.embeddings[1], [0, 1])
+
+    gallery.remove('db/a/1.jpg')
+    _, identities = EmbeddingStore(str(tmp_path), normalize=False).open()
+    assert identities == [None, None]
+
+
+def test_load_compacts_tombstoned_rows(tmp_path):
+    from gallery import EmbeddingGallery
+
+    store = EmbeddingStore(str(tmp_path), normalize=False)
+    store.rewrite(['db/a/1.jpg', 'db/b/1.jpg'], [[1, 0], [0, 1]])
+    gallery = EmbeddingGallery(None, "euclidean", store)
+    gallery.load(str(tmp_path / "db"))  # Neither image exists, so both rows are tombstoned
+
+    _, identities = EmbeddingStore(str(tmp_path), normalize=False).open()
+    assert identities == []
+
+
+def test_rewrite_swaps_generations_through_the_meta_file(tmp_path):
+    store = EmbeddingStore(str(tmp_path), normalize=False)
+    store.rewrite(['a', 'b'], [[1, 0], [0, 1]])
+    store.rewrite(['c'], [[5, 5]])
+    new_files = sorted(p.name for p in tmp_path.iterdir() if p.suffix in ('.emb', '.jsonl'))
+    assert len(new_files) == 2  # The previous generation's files were removed
+
+    # A rewrite that crashed before its meta swap leaves the previous store intact
+    crashed = EmbeddingStore(str(tmp_path), normalize=False)
+    crashed.open()
+    crashed._new_generation()
+    with open(crashed.matrix_path, 'wb') as f:
+        f.write(np.array([[7, 7]], dtype=np.float32).tobytes())
+
+    embeddings, identities = EmbeddingStore(str(tmp_path), normalize=False).open()
+    assert identities == ['c']
+    np.testing.assert_array_equal(embeddings[0], [5, 5])
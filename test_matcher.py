@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from matcher import EmbeddingMatcher, DISTANCE_METRICS
+
+
+def brute_force(gallery, labels, probe, metric, k):
+    """Top-k (label, distance) by computing every distance one row at a time"""
+    results = []
+    for row, label in zip(gallery, labels):
+        if label is None:
+            continue
+        if metric == "euclidean":
+            distance = np.linalg.norm(probe - row)
+        elif metric == "euclidean_l2":
+            distance = np.linalg.norm(probe / np.linalg.norm(probe) - row / np.linalg.norm(row))
+        else:
+            distance = 1 - probe @ row / (np.linalg.norm(probe) * np.linalg.norm(row))
+        results.append((label, float(distance)))
+    return sorted(results, key=lambda match: match[1])[:k]
+
+
+def assert_same(matches, expected):
+    assert [label for label, _ in matches] == [label for label, _ in expected]
+    np.testing.assert_allclose([d for _, d in matches], [d for _, d in expected], rtol=1e-4, atol=1e-5)
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((50, 16)).astype(np.float32), rng.standard_normal((5, 16)).astype(np.float32)
+
+
+@pytest.mark.parametrize("metric", DISTANCE_METRICS)
+def test_search_matches_brute_force(data, metric):
+    gallery, probes = data
+    labels = [f"row{i}" for i in range(len(gallery))]
+    results = EmbeddingMatcher(gallery, labels, metric).search(probes, k=3)
+    for probe, matches in zip(probes, results):
+        assert_same(matches, brute_force(gallery, labels, probe, metric, 3))
+
+
+@pytest.mark.parametrize("metric", DISTANCE_METRICS)
+def test_extended_and_relabeled_match_brute_force(data, metric):
+    gallery, probes = data
+    labels = [f"row{i}" for i in range(len(gallery))]
+    matcher = EmbeddingMatcher(gallery[:20], labels[:20], metric).extended(gallery, labels)
+
+    deleted = list(labels)
+    for row in range(0, len(deleted), 3):
+        deleted[row] = None
+    matcher = matcher.relabeled(deleted)
+
+    for probe, matches in zip(probes, matcher.search(probes, k=5)):
+        assert_same(matches, brute_force(gallery, deleted, probe, metric, 5))
+        assert all(label is not None for label, _ in matches)
+
+
+def test_prenormalized_rows_are_used_as_they_are(data):
+    gallery, probes = data
+    unit = gallery / np.linalg.norm(gallery, axis=1, keepdims=True)
+    labels = [f"row{i}" for i in range(len(gallery))]
+    expected = EmbeddingMatcher(gallery, labels, "cosine").search(probes, k=3)
+    for matches, reference in zip(EmbeddingMatcher(unit, labels, "cosine", prenormalized=True).search(probes, k=3), expected):
+        assert_same(matches, reference)
+
+
+def test_empty_gallery_returns_no_matches():
+    matcher = EmbeddingMatcher(np.zeros((1, 4)), [None], "cosine")
+    assert matcher.search(np.ones((2, 4))) == [[], []]
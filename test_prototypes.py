@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from ann_index import ExactIndex
+from gallery import identity_name
+from prototypes import PrototypeIndex, PROTOTYPE_METHODS
+
+PEOPLE = ["alice", "bob", "carol", "dave", "erin", "frank"]
+
+
+@pytest.fixture
+def clusters():
+    """Well-separated photos of each person, and probes drawn near every person"""
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((len(PEOPLE), 64)).astype(np.float32)
+    gallery = np.vstack([center + 0.05 * rng.standard_normal((5, 64)) for center in centers]).astype(np.float32)
+    labels = [f"face_database/{name}/{i}.jpg" for name in PEOPLE for i in range(5)]
+    probes = (centers + 0.05 * rng.standard_normal(centers.shape)).astype(np.float32)
+    return gallery, labels, probes
+
+
+def identities(results):
+    return [[identity_name(label) for label, _ in matches] for matches in results]
+
+
+@pytest.mark.parametrize("method", PROTOTYPE_METHODS)
+@pytest.mark.parametrize("metric", ["cosine", "euclidean"])
+def test_prototypes_match_exact_search(clusters, method, metric):
+    gallery, labels, probes = clusters
+    index = PrototypeIndex(gallery, labels, metric, group_of=identity_name, method=method, margin=0)
+    exact = ExactIndex(gallery, labels, metric).search(probes, k=1)
+
+    assert identities(index.search(probes, k=1)) == identities(exact) == [[name] for name in PEOPLE]
+    # Every identity is returned once, closest first
+    assert all(sorted(names) == sorted(PEOPLE) for names in identities(index.search(probes, k=len(PEOPLE))))
+
+
+@pytest.mark.parametrize("method", PROTOTYPE_METHODS)
+def test_borderline_matches_are_verified_against_every_photo(clusters, method):
+    gallery, labels, probes = clusters
+    # A margin covering every distance sends each match through exact verification
+    index = PrototypeIndex(gallery, labels, group_of=identity_name, method=method, margin=10)
+    results, exact = index.search(probes, k=1), ExactIndex(gallery, labels).search(probes, k=1)
+    assert [[label for label, _ in matches] for matches in results] == [[label for label, _ in matches] for matches in exact]
+    np.testing.assert_allclose([matches[0][1] for matches in results], [matches[0][1] for matches in exact], atol=1e-6)
+
+
+@pytest.mark.parametrize("method", PROTOTYPE_METHODS)
+def test_extended_and_relabeled_refresh_prototypes(clusters, method):
+    gallery, labels, probes = clusters
+    index = PrototypeIndex(gallery[:20], labels[:20], group_of=identity_name, method=method, margin=0)
+    index = index.extended(gallery, labels)
+    assert identities(index.search(probes, k=1)) == [[name] for name in PEOPLE]
+
+    # Deleting every photo of a person removes them from the results
+    deleted = [None if identity_name(label) == "bob" else label for label in labels]
+    index = index.relabeled(deleted)
+    assert "bob" not in index.identity_names
+    assert all("bob" not in names for names in identities(index.search(probes, k=len(PEOPLE))))
@@ -0,0 +1,182 @@
+"""
+Face tracking between frames
+Keeps identities attached to face boxes so recognition runs once per track instead of once per frame
+"""
+
+import time
+import cv2
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    intersection = inter_w * inter_h
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union else 0.0
+
+
+def centroid_distance(a, b):
+    """Distance between box centres, relative to the size of box a"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    dx = (ax + aw / 2) - (bx + bw / 2)
+    dy = (ay + ah / 2) - (by + bh / 2)
+    return (dx * dx + dy * dy) ** 0.5 / max(aw, ah, 1)
+
+
+def create_cv_tracker():
+    """Return a KCF tracker if this OpenCV build has one, otherwise None"""
+    for module in (cv2, getattr(cv2, 'legacy', None)):
+        factory = getattr(module, 'TrackerKCF_create', None) if module is not None else None
+        if factory is not None:
+            return factory()
+    return None
+
+
+class Track:
+    """One face followed across frames, with its latest recognition result"""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = tuple(int(v) for v in box)
+        self.hits = 1
+        self.missed = 0
+        self.result = None
+        self.confidence = None
+        self.recognized = False
+        self.recognized_at = None
+        self.cv_tracker = None
+
+
+class FaceTracker:
+    """Associates detected face boxes with existing tracks by IoU, falling back to centroid distance"""
+
+    def __init__(self, iou_threshold=0.3, max_centroid_distance=0.5, max_missed=5,
+                 refresh_interval=5.0, min_confidence=0.2, low_confidence_interval=1.0,
+                 use_cv_trackers=False):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_missed = max_missed  # Frames a track survives without a matching detection
+        self.refresh_interval = refresh_interval  # Seconds before a confident result is re-checked
+        self.min_confidence = min_confidence  # Results below this are re-checked sooner
+        self.low_confidence_interval = low_confidence_interval
+        self.use_cv_trackers = use_cv_trackers
+        self.tracks = {}
+        self.next_track_id = 0
+
+    def _new_track(self, box, frame):
+        track = Track(self.next_track_id, box)
+        self.next_track_id += 1
+        self.tracks[track.track_id] = track
+        self._init_cv_tracker(track, frame)
+        return track
+
+    def _init_cv_tracker(self, track, frame):
+        if self.use_cv_trackers and frame is not None:
+            track.cv_tracker = create_cv_tracker()
+            if track.cv_tracker is not None:
+                track.cv_tracker.init(frame, track.box)
+
+    def _associate(self, faces):
+        # Greedy matching: best IoU first, then closest centroid for boxes that moved a lot
+        pairs = []
+        for i, box in enumerate(faces):
+            for track_id, track in self.tracks.items():
+                overlap = box_iou(box, track.box)
+                if overlap >= self.iou_threshold:
+                    pairs.append((-overlap, i, track_id))
+                else:
+                    distance = centroid_distance(track.box, box)
+                    if distance <= self.max_centroid_distance:
+                        pairs.append((distance, i, track_id))
+
+        matches = {}
+        used_tracks = set()
+        for _, i, track_id in sorted(pairs):
+            if i in matches or track_id in used_tracks:
+                continue
+            matches[i] = track_id
+            used_tracks.add(track_id)
+        return matches
+
+    def update(self, faces, frame=None):
+        """Match this frame's detections to tracks and return the tracks visible in it"""
+        matches = self._associate(faces)
+        visible = []
+
+        for i, box in enumerate(faces):
+            if i in matches:
+                track = self.tracks[matches[i]]
+                track.box = tuple(int(v) for v in box)
+                track.hits += 1
+                track.missed = 0
+                self._init_cv_tracker(track, frame)
+            else:
+                track = self._new_track(box, frame)
+            visible.append(track)
+
+        seen_ids = {track.track_id for track in visible}
+        for track_id, track in list(self.tracks.items()):
+            if track_id in seen_ids:
+                continue
+
+            track.missed += 1
+            if track.missed > self.max_missed:
+                del self.tracks[track_id]
+                continue
+
+            # Follow faces the detector missed with the OpenCV tracker, when enabled
+            if track.cv_tracker is not None and frame is not None:
+                ok, box = track.cv_tracker.update(frame)
+                if ok:
+                    track.box = tuple(int(v) for v in box)
+                    visible.append(track)
+
+        return visible
+
+    def predict(self, frame=None):
+        """Tracks to show on a frame where detection was skipped, moved by the OpenCV trackers if enabled"""
+        visible = []
+        for track in self.tracks.values():
+            if track.missed:
+                continue
+
+            if track.cv_tracker is not None and frame is not None:
+                ok, box = track.cv_tracker.update(frame)
+                if ok:
+                    track.box = tuple(int(v) for v in box)
+            visible.append(track)
+        return visible
+
+    def needs_recognition(self, track, now=None):
+        """True for new tracks, after the refresh interval, or sooner when confidence is low"""
+        if track.recognized_at is None:
+            return True
+
+        now = time.monotonic() if now is None else now
+        elapsed = now - track.recognized_at
+        if elapsed >= self.refresh_interval:
+            return True
+        if track.recognized and (track.confidence is None or track.confidence < self.min_confidence):
+            return elapsed >= self.low_confidence_interval
+        return False
+
+    def mark_submitted(self, track, now=None):
+        """Record that recognition was started for a track"""
+        track.recognized_at = time.monotonic() if now is None else now
+
+    def set_result(self, track_id, result, confidence=None):
+        """Attach a recognition result to a track, if it is still alive"""
+        track = self.tracks.get(track_id)
+        if track is None:
+            return False
+        track.result = result
+        track.confidence = confidence
+        track.recognized = True
+        return True
+
+    def track_ids(self):
+        return list(self.tracks)
@@ -0,0 +1,67 @@
+"""
+Unknown face capture
+Saves unknown faces at most once per track and cooldown, skipping near-duplicates, off the frame loop
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from template_gallery import normalize_template
+
+
+class UnknownFaceRecorder:
+    """Writes unknown faces to disk on a background thread, deduplicated per track and by similarity"""
+
+    def __init__(self, directory, cooldown=30.0, similarity_threshold=0.8, recent_size=50, size=(100, 100)):
+        self.directory = directory
+        self.cooldown = cooldown  # Seconds before the same track may be saved again
+        self.similarity_threshold = similarity_threshold  # Skip faces this close to a recent save
+        self.size = size
+        self.lock = threading.Lock()
+        self.saved_at = {}
+        self.recent = deque(maxlen=recent_size)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='unknown-faces')
+        os.makedirs(directory, exist_ok=True)
+
+    def _is_duplicate(self, template):
+        if not self.recent:
+            return False
+        scores = np.vstack(self.recent) @ template
+        return float(scores.max()) > self.similarity_threshold
+
+    def consider(self, track_id, face_img, now=None):
+        """Queue a face for saving unless it was saved recently; returns the path it will be written to"""
+        now = time.time() if now is None else now
+        face_small = cv2.resize(face_img, self.size)
+        template = normalize_template(cv2.cvtColor(face_small, cv2.COLOR_BGR2GRAY))
+
+        with self.lock:
+            # Forget tracks whose cooldown has passed so the dict stays small
+            for old_id in [t for t, saved in self.saved_at.items() if now - saved >= self.cooldown]:
+                del self.saved_at[old_id]
+
+            if track_id in self.saved_at or self._is_duplicate(template):
+                return None
+
+            self.saved_at[track_id] = now
+            self.recent.append(template)
+
+        path = os.path.join(self.directory, f"unknown{int(now * 1000)}.jpg")
+        self.executor.submit(self._write, path, face_small)
+        return path
+
+    def _write(self, path, face_img):
+        try:
+            cv2.imwrite(path, face_img)
+        except Exception as e:
+            print(f"Error saving unknown face to {path}: {e}")
+
+    def list_faces(self):
+        """File names of the saved unknown faces"""
+        if not os.path.exists(self.directory):
+            return []
+        return sorted(f for f in os.listdir(self.directory) if f.startswith('unknown'))